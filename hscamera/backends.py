@@ -0,0 +1,336 @@
+import sys
+import logging
+import threading
+import time
+
+import numpy as np
+
+
+class SegmentedMemory:
+    # Frame memory allocated here in segments and registered with the grabber one sub buffer at a
+    # time under a memory head. Fg_AllocMemEx is limited to about 4 GB, a memory head is not.
+    # Sub buffers are numbered consecutively through the segments.
+
+    def __init__(self, head, segments, subbuffer_size, segment_numpics):
+        self.head = head
+        self.segments = segments
+        self.subbuffer_size = subbuffer_size
+        self.segment_numpics = segment_numpics
+        self.numpics = sum(len(segment) for segment in segments)
+
+
+# Silicon Software frame grabber with the camera's serial line reached through clshell
+class SisoBackend:
+
+    sdk_paths = ["/opt/SiliconSoftware/Runtime5.7.0/SDKWrapper/PythonWrapper/python36/bin",
+                 "/opt/SiliconSoftware/Runtime5.7.0/SDKWrapper/PythonWrapper/python36/lib",
+                 "/opt/ConfigFiles",
+                 "/opt/SiliconSoftware/Runtime5.7.0/lib64"]
+    clshell_command = '/opt/SiliconSoftware/Runtime5.7.0/bin/clshell -a -i'
+    # clshell option selecting the serial port, numbered through the boards' camera link ports
+    clshell_port_option = ' -p {}'
+    serial_ports_per_board = 2
+    # Commands asking the camera for a setting, keyed by the setting's command code. The reply is the
+    # setting's argument list so CommandChannel can tell which settings already match. None are
+    # listed for this camera so every setting is sent when a channel is attached.
+    settings_queries = {}
+    # Seconds per FG_TIMESTAMP_LONG tick
+    timestamp_tick = 1e-9
+
+    # Frame grabber handles shared by every backend using the same board and mcf file
+    frame_grabbers = {}
+
+    def __init__(self, board=0, port=0, clshell_command=None):
+        # Each camera is a board and DMA port pair. clshell_command reaches the serial port of the
+        # camera and is built from board and port unless given. The first port keeps the plain
+        # command used for a single camera.
+        for path in self.sdk_paths:
+            if path not in sys.path:
+                sys.path.append(path)
+        import SiSoPyInterface
+        self.SISO = SiSoPyInterface
+        self.GRAB_INFINITE = self.SISO.GRAB_INFINITE
+        self.board = board
+        self.port = port
+        if clshell_command is None:
+            serial_port = board * self.serial_ports_per_board + port
+            if serial_port > 0:
+                clshell_command = self.clshell_command + self.clshell_port_option.format(serial_port)
+        if clshell_command is not None:
+            self.clshell_command = clshell_command
+        self.frame_grabber = None
+        self.camera_com = None
+
+    def init_config(self, mcf_filename):
+        key = (self.board, mcf_filename)
+        if key not in self.frame_grabbers:
+            # Not Really sure why I have both of these lines
+            frame_grabber = self.SISO.Fg_InitConfig(mcf_filename, self.board)
+            self.SISO.Fg_loadConfig(frame_grabber, mcf_filename)
+            self.frame_grabbers[key] = frame_grabber
+        self.frame_grabber = self.frame_grabbers[key]
+
+    def alloc_mem(self, buffer_size, numpics, segment_numpics=None):
+        # Reserves an aera of the main memory as frame buffer, blocks it and makes it available for the user.
+        # With segment_numpics the memory is allocated here in segments of that many sub buffers instead.
+        if segment_numpics is None or segment_numpics >= numpics:
+            return self.SISO.Fg_AllocMemEx(self.frame_grabber, buffer_size, numpics)
+        subbuffer_size = buffer_size // numpics
+        head = self.SISO.Fg_AllocMemHead(self.frame_grabber, buffer_size, numpics)
+        segments = []
+        for first in range(0, numpics, segment_numpics):
+            # zeros rather than empty so the pages are resident before the grabber writes to them
+            segment = np.zeros((min(segment_numpics, numpics - first), subbuffer_size), dtype=np.uint8)
+            for k in range(len(segment)):
+                self.SISO.Fg_AddMem(self.frame_grabber, segment[k].ctypes.data, subbuffer_size, first + k, head)
+            segments.append(segment)
+        return SegmentedMemory(head, segments, subbuffer_size, segment_numpics)
+
+    def free_mem(self, mem_handle):
+        if isinstance(mem_handle, SegmentedMemory):
+            for index in range(mem_handle.numpics):
+                self.SISO.Fg_DelMem(self.frame_grabber, mem_handle.head, index)
+            self.SISO.Fg_FreeMemHead(self.frame_grabber, mem_handle.head)
+            mem_handle.segments = None
+        else:
+            self.SISO.Fg_FreeMemEx(self.frame_grabber, mem_handle)
+
+    def _handle(self, mem_handle):
+        return mem_handle.head if isinstance(mem_handle, SegmentedMemory) else mem_handle
+
+    def acquire(self, numpics, mem_handle):
+        return self.SISO.Fg_AcquireEx(self.frame_grabber, self.port, numpics, self.SISO.ACQ_STANDARD,
+                                      self._handle(mem_handle))
+
+    def last_pic_number(self, mem_handle):
+        return self.SISO.Fg_getLastPicNumberEx(self.frame_grabber, self.port, self._handle(mem_handle))
+
+    def image_ptr(self, index, mem_handle):
+        return self.SISO.Fg_getImagePtrEx(self.frame_grabber, index, self.port, self._handle(mem_handle))
+
+    def get_array(self, ptr, width, height):
+        return self.SISO.getArrayFrom(ptr, width, height)
+
+    def get_frames(self, start, stop, width, height, mem_handle, subbuffer_size=None):
+        # Sub buffers of an Fg_AllocMemEx allocation are contiguous so the run of pictures
+        # start..stop-1 (which must not wrap around the buffer) can be viewed as one array.
+        # When the ROI is smaller than the sub buffers the view steps subbuffer_size bytes per frame.
+        if isinstance(mem_handle, SegmentedMemory):
+            # The run must also stay within one segment, which is memory we own
+            slot = (start - 1) % mem_handle.numpics
+            segment = mem_handle.segments[slot // mem_handle.segment_numpics]
+            first = slot % mem_handle.segment_numpics
+            return segment[first:first + stop - start, :width * height].reshape((stop - start, height, width))
+        if subbuffer_size is None:
+            subbuffer_size = width * height
+        ptr = self.image_ptr(start, mem_handle)
+        slots = self.SISO.getArrayFrom(ptr, subbuffer_size, stop - start)
+        return slots[:, :width * height].reshape((stop - start, height, width))
+
+    def timestamps(self, start, stop, mem_handle):
+        # Grabber timestamps of pictures start..stop-1 in seconds, or None if the runtime cannot
+        # provide them in which case callers fall back to host time
+        times = np.empty(stop - start)
+        try:
+            for i, index in enumerate(range(start, stop)):
+                err, ticks = self.SISO.Fg_getParameterEx(self.frame_grabber, self.SISO.FG_TIMESTAMP_LONG,
+                                                         self.port, self._handle(mem_handle), index)
+                if err != 0:
+                    return None
+                times[i] = ticks * self.timestamp_tick
+        except (AttributeError, TypeError, ValueError):
+            return None
+        return times
+
+    def stop(self):
+        self.SISO.Fg_stopAcquire(self.frame_grabber, self.port)
+
+    def com_key(self):
+        return self.board, self.port, self.clshell_command
+
+    def com_alive(self):
+        return self.camera_com is not None and self.camera_com.isalive()
+
+    def open_com(self):
+        import pexpect
+        self.camera_com = pexpect.spawn(self.clshell_command)
+        for f in range(5):
+            self.camera_com.readline()
+
+    def send_command(self, command, expect_return_value=False):
+        self.camera_com.sendline(command.encode())
+        input_line = self.camera_com.readline()
+        if expect_return_value:
+            result = self.camera_com.readline().decode().strip()
+            if result[0] == '>':
+                return result[1:-1]
+            else:
+                return result[:-1]
+        else:
+            result = self.camera_com.readline()
+            return None
+
+
+class SimulatedBuffer:
+    # Sub buffers are held in segments of segment_numpics like SegmentedMemory, one segment by default
+
+    def __init__(self, buffer_size, numpics, segment_numpics=None):
+        self.numpics = numpics
+        self.subbuffer_size = buffer_size // numpics
+        self.segment_numpics = numpics if segment_numpics is None else min(segment_numpics, numpics)
+        self.segments = [np.zeros((min(self.segment_numpics, numpics - first), self.subbuffer_size), dtype=np.uint8)
+                         for first in range(0, numpics, self.segment_numpics)]
+        self.timestamps = np.zeros(numpics, dtype=np.float64)
+        self.last = 0
+
+    def slot(self, index):
+        return (index - 1) % self.numpics
+
+    def subbuffer(self, slot):
+        return self.segments[slot // self.segment_numpics][slot % self.segment_numpics]
+
+
+# Pure NumPy stand in for the frame grabber and camera so acquisition can run off the rig.
+# Frames are produced on a background thread at the simulated framerate into a ring buffer
+# numbered like Fg_getLastPicNumberEx. Frame content is copied from a small precomputed bank
+# so that, like DMA, producing frames costs little CPU.
+class SimulatedBackend:
+
+    GRAB_INFINITE = -1
+    # Readout bandwidth in pixels per second and sensor framerate ceiling used for #A
+    bandwidth = 5.2e8
+    max_sensor_framerate = 285000
+    bank_size = 16
+    # As for SisoBackend, the simulated camera answers '#R?', '#r?' and '#e?' with its current values
+    settings_queries = {'#R': '#R?', '#r': '#r?', '#e': '#e?'}
+
+    def __init__(self, width=1024, height=1024, framerate=30, exposure=15000, board=0, port=0):
+        self.board = board
+        self.port = port
+        self.state = {'x': 0, 'y': 0, 'width': width, 'height': height,
+                      'framerate': framerate, 'exposure': exposure}
+        self.commands_sent = 0
+        self._running = threading.Event()
+        self._thread = None
+
+    def init_config(self, mcf_filename):
+        logging.info('Simulated framegrabber ignoring mcf file {}'.format(mcf_filename))
+
+    def alloc_mem(self, buffer_size, numpics, segment_numpics=None):
+        return SimulatedBuffer(buffer_size, numpics, segment_numpics)
+
+    def free_mem(self, mem_handle):
+        mem_handle.segments = None
+
+    def acquire(self, numpics, mem_handle):
+        self.stop()
+        mem_handle.last = 0
+        width, height = self.state['width'], self.state['height']
+        assert width * height <= mem_handle.subbuffer_size, 'ROI does not fit in the allocated buffer'
+        bank = self._frame_bank(width, height)
+        self._running.set()
+        self._thread = threading.Thread(target=self._produce, args=(mem_handle, numpics, bank), daemon=True)
+        self._thread.start()
+        return 0
+
+    def last_pic_number(self, mem_handle):
+        return mem_handle.last
+
+    def image_ptr(self, index, mem_handle):
+        return mem_handle, mem_handle.slot(index)
+
+    def get_array(self, ptr, width, height):
+        mem_handle, slot = ptr
+        return mem_handle.subbuffer(slot)[:width * height].reshape((height, width))
+
+    def get_frames(self, start, stop, width, height, mem_handle, subbuffer_size=None):
+        slot = mem_handle.slot(start)
+        segment = mem_handle.segments[slot // mem_handle.segment_numpics]
+        first = slot % mem_handle.segment_numpics
+        return segment[first:first + stop - start, :width * height].reshape((stop - start, height, width))
+
+    def timestamps(self, start, stop, mem_handle):
+        slots = (np.arange(start, stop) - 1) % mem_handle.numpics
+        return mem_handle.timestamps[slots]
+
+    def stop(self):
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def com_key(self):
+        # The simulated camera state lives in this backend so its link is never shared
+        return id(self)
+
+    def com_alive(self):
+        return True
+
+    def open_com(self):
+        logging.debug('Simulated camera communication opened')
+
+    def send_command(self, command, expect_return_value=False):
+        self.commands_sent += 1
+        code = command[1]
+        args = command[2:].strip('()')
+        if args == '?':
+            return self._report(code)
+        if code == 'R':
+            x, y, width, height = (int(v) for v in args.split(','))
+            self.state.update(x=x, y=y, width=width, height=height)
+            self.state['framerate'] = min(self.state['framerate'], self.max_framerate())
+        elif code == 'r':
+            self.state['framerate'] = min(int(args), self.max_framerate())
+        elif code == 'e':
+            self.state['exposure'] = min(int(args), self.max_exposure())
+        elif code == 'A':
+            return str(self.max_framerate())
+        elif code == 'a':
+            return str(self.max_exposure())
+        return None
+
+    def _report(self, code):
+        if code == 'R':
+            return '{x},{y},{width},{height}'.format(**self.state)
+        return str(self.state[{'r': 'framerate', 'e': 'exposure'}[code]])
+
+    def max_framerate(self):
+        pixels = (self.state['width'] + 16) * (self.state['height'] + 2)
+        return int(min(self.max_sensor_framerate, self.bandwidth / pixels))
+
+    def max_exposure(self):
+        return int(1e6 / self.state['framerate']) - 2
+
+    def _frame_bank(self, width, height):
+        rng = np.random.default_rng(0)
+        yy, xx = np.mgrid[0:height, 0:width]
+        background = 40 + 60 * xx / max(width - 1, 1)
+        bank = np.empty((self.bank_size, height, width), dtype=np.uint8)
+        for i in range(self.bank_size):
+            cx = width * (0.2 + 0.6 * i / self.bank_size)
+            cy = height / 2
+            blob = 150 * np.exp(-((xx - cx) ** 2 + (yy - cy) ** 2) / (2 * (0.05 * max(width, height)) ** 2))
+            noise = rng.normal(0, 4, size=(height, width))
+            bank[i] = np.clip(background + blob + noise, 0, 255)
+        return bank
+
+    def _produce(self, mem_handle, numpics, bank):
+        framerate = self.state['framerate']
+        frame_size = bank[0].size
+        t0 = time.perf_counter()
+        produced = 0
+        while self._running.is_set():
+            now = time.perf_counter()
+            due = int((now - t0) * framerate)
+            if numpics != self.GRAB_INFINITE:
+                due = min(due, numpics)
+            # Frames that would be overwritten within this step are never visible so skip writing them
+            for n in range(max(produced + 1, due - mem_handle.numpics + 1), due + 1):
+                slot = mem_handle.slot(n)
+                mem_handle.subbuffer(slot)[:frame_size] = bank[n % self.bank_size].ravel()
+                mem_handle.timestamps[slot] = t0 + n / framerate
+            produced = max(produced, due)
+            mem_handle.last = produced
+            if numpics != self.GRAB_INFINITE and produced >= numpics:
+                break
+            time.sleep(min(1 / framerate, 0.002))
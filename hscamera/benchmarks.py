@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+
+import numpy as np
+
+from backends import SimulatedBackend
+from camera import Camera
+from writers import formats, open_writer
+
+# Times the acquisition, save and preview hot paths against the simulated frame grabber over a
+# matrix of ROI sizes and frame counts and writes the results as JSON so runs can be compared.
+#
+#   python benchmarks.py --output results.json
+#   python benchmarks.py --compare before.json after.json
+
+rois = [(16, 2), (128, 128), (512, 512), (1024, 1024)]
+frame_counts = [100, 1000]
+
+
+def time_call(fn, repeat):
+    times = []
+    for i in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return min(times), float(np.mean(times))
+
+
+def result(name, width, height, numpics, seconds, frames, nbytes):
+    return {'benchmark': name, 'width': width, 'height': height, 'numpics': numpics,
+            'seconds': seconds, 'frames_per_s': frames / seconds if seconds else 0.0,
+            'mb_per_s': nbytes / seconds / 1e6 if seconds else 0.0}
+
+
+def fill_buffer(cam, numpics):
+    cam.start(numpics)
+    while cam.backend.last_pic_number(cam.mem_handle) < numpics:
+        time.sleep(0.01)
+
+
+def bench_settings(cam, repeat):
+    results = []
+    # Alternate between two ROIs so every apply sends real commands
+    settings = [dict(cam.settings, width=512, height=512), dict(cam.settings, width=1024, height=1024)]
+    t = time.perf_counter()
+    for i in range(repeat):
+        cam.apply_settings(settings[i % 2])
+    seconds = (time.perf_counter() - t) / repeat
+    results.append(result('apply_settings', 0, 0, 0, seconds, 1, 0))
+    for code, timing in cam.com.timing_summary().items():
+        results.append(result('command ' + code, 0, 0, 0, timing['mean_ms'] / 1e3, 1, 0))
+    return results
+
+
+def bench_roi(cam, width, height, numpics, repeat, directory):
+    results = []
+    cam.apply_settings({'width': width, 'height': height})
+    cam.set_framerate(cam.get_max_framerate())
+    fill_buffer(cam, numpics)
+    frame_bytes = width * height
+
+    index = numpics // 2
+    for name, fn in [('get_img view', lambda: cam.get_img(index)),
+                     ('get_img copy', lambda: cam.get_img(index, copy=True)),
+                     ('get_img color', lambda: cam.get_img(index, color=True)),
+                     ('get_current_img', lambda: cam.get_current_img())]:
+        best, mean = time_call(fn, repeat * 10)
+        results.append(result(name, width, height, numpics, best, 1, frame_bytes))
+
+    best, mean = time_call(lambda: cam.get_frames(1, numpics + 1, copy=True), repeat)
+    results.append(result('get_frames copy', width, height, numpics, best, numpics, numpics * frame_bytes))
+
+    for extension in formats:
+        filename = os.path.join(directory, 'bench' + extension)
+        t = time.perf_counter()
+        writer = open_writer(filename, width, height, framerate=cam.settings['framerate'], settings=cam.settings)
+        for start in range(1, numpics + 1, cam.save_chunk):
+            writer.add_frames(cam.get_frames(start, min(start + cam.save_chunk, numpics + 1)))
+        writer.close()
+        seconds = time.perf_counter() - t
+        results.append(result('write ' + extension, width, height, numpics, seconds, numpics, numpics * frame_bytes))
+        os.remove(filename)
+    cam.stop()
+    return results
+
+
+def run(repeat=3, directory=None):
+    cam = Camera(backend=SimulatedBackend())
+    results = bench_settings(cam, repeat * 10)
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        for width, height in rois:
+            for numpics in frame_counts:
+                logging.info('Benchmarking {}x{} with {} frames'.format(width, height, numpics))
+                results.extend(bench_roi(cam, width, height, numpics, repeat, tmp))
+    buffer_stats = cam.buffer_stats()
+    cam.close()
+    return {'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'host': platform.node(),
+                     'python': platform.python_version(), 'numpy': np.__version__, 'buffer': buffer_stats},
+            'results': results}
+
+
+def key(r):
+    return r['benchmark'], r['width'], r['height'], r['numpics']
+
+
+def compare(before_file, after_file, threshold=0.1):
+    with open(before_file) as f:
+        before = {key(r): r for r in json.load(f)['results']}
+    with open(after_file) as f:
+        after = {key(r): r for r in json.load(f)['results']}
+    regressions = 0
+    for k in sorted(set(before) & set(after)):
+        old, new = before[k]['seconds'], after[k]['seconds']
+        ratio = new / old if old else float('nan')
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print('{:<24} {:>5}x{:<5} n={:<6} {:10.6f}s -> {:10.6f}s  x{:.2f}{}'.format(
+            k[0], k[1], k[2], k[3], old, new, ratio, flag))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark hscamera hot paths against the simulated grabber')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--dir', default=None, help='Directory for temporary output files')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'))
+    parser.add_argument('--threshold', type=float, default=0.1, help='Slowdown fraction reported as a regression')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, threshold=args.threshold) else 0)
+    results = run(args.repeat, args.dir)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1)
+    logging.info('Results written to {}'.format(args.output))
@@ -0,0 +1,109 @@
+import time
+import logging
+
+
+def available_memory():
+    # MemAvailable from /proc/meminfo in bytes, None where that is not available
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def resident_memory():
+    # VmRSS of this process in bytes, None where /proc is not available
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class GrabberBuffer:
+    # One frame grabber allocation of numpics sub buffers of subbuffer_size bytes each.
+    # A frame smaller than the sub buffer sits at the start of it, so consecutive frames are
+    # subbuffer_size bytes apart, except between segments of segment_numpics sub buffers.
+
+    def __init__(self, mem_handle, subbuffer_size, numpics, alloc_time, segment_numpics=None):
+        self.mem_handle = mem_handle
+        self.subbuffer_size = subbuffer_size
+        self.numpics = numpics
+        self.alloc_time = alloc_time
+        self.segment_numpics = numpics if segment_numpics is None else segment_numpics
+        self.owner = None
+
+    @property
+    def size(self):
+        return self.subbuffer_size * self.numpics
+
+    def fits(self, frame_size, numpics):
+        return frame_size <= self.subbuffer_size and numpics <= self.numpics
+
+
+class BufferManager:
+    # Keeps the grabber allocation alive between takes. Allocating and pinning several GB is slow,
+    # so a request that fits in the current allocation (a smaller ROI or fewer pictures) reuses it
+    # and only a request for more sub buffers or bigger ones frees it and allocates again.
+    # The buffer is lent to one owner at a time and must be released before it can be freed.
+    # Buffers bigger than a single grabber allocation allows are made of segments of segment_bytes.
+
+    single_alloc_limit = 4e9
+    segment_bytes = 2 ** 30
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.buffer = None
+        self.allocations = 0
+        self.reuses = 0
+        self.alloc_time = 0.0
+
+    def acquire(self, frame_size, numpics, owner):
+        assert self.buffer is None or self.buffer.owner in (None, owner), \
+            'Grabber buffer is in use by {}'.format(self.buffer.owner)
+        if self.buffer is not None and self.buffer.fits(frame_size, numpics):
+            self.reuses += 1
+            logging.debug('Reusing {:.2f} GB grabber buffer'.format(self.buffer.size / 1e9))
+        else:
+            if self.buffer is not None:
+                self.buffer.owner = None
+            self.free()
+            logging.debug('Initialising buffer of size {} GB'.format(frame_size * numpics / 1e9))
+            segment_numpics = None
+            if frame_size * numpics > self.single_alloc_limit:
+                segment_numpics = max(1, int(self.segment_bytes // frame_size))
+            t = time.perf_counter()
+            mem_handle = self.backend.alloc_mem(frame_size * numpics, numpics, segment_numpics)
+            duration = time.perf_counter() - t
+            self.buffer = GrabberBuffer(mem_handle, frame_size, numpics, duration, segment_numpics)
+            self.allocations += 1
+            self.alloc_time += duration
+            logging.info('Buffer of {:.2f} GB allocated in {:.2f} s'.format(self.buffer.size / 1e9, duration))
+        self.buffer.owner = owner
+        return self.buffer
+
+    def release(self, owner):
+        if self.buffer is not None and self.buffer.owner == owner:
+            self.buffer.owner = None
+
+    def free(self):
+        if self.buffer is None:
+            return
+        assert self.buffer.owner is None, 'Grabber buffer is in use by {}'.format(self.buffer.owner)
+        self.backend.free_mem(self.buffer.mem_handle)
+        logging.info('Memory buffer cleared')
+        self.buffer = None
+
+    def stats(self):
+        return {'allocated_bytes': 0 if self.buffer is None else self.buffer.size,
+                'subbuffer_size': None if self.buffer is None else self.buffer.subbuffer_size,
+                'numpics': 0 if self.buffer is None else self.buffer.numpics,
+                'segments': 0 if self.buffer is None else -(-self.buffer.numpics // self.buffer.segment_numpics),
+                'allocations': self.allocations, 'reuses': self.reuses, 'alloc_time': self.alloc_time,
+                'resident_bytes': resident_memory()}
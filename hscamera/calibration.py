@@ -0,0 +1,142 @@
+import time
+import logging
+import threading
+
+import numpy as np
+
+from rawvideo import RawVideoReader, RawVideoWriter
+
+# Dark frame subtraction and flat field normalisation in software.
+#   corrected = (raw - dark) * mean(flat - dark) / (flat - dark)
+# For 8 bit frames every pixel's (dark, gain) pair is quantised into one of a limited number of
+# classes and the corrected value of each class is tabulated for all 256 inputs, so correcting a
+# frame is one add into a preallocated index buffer and one np.take from the table.
+
+
+class FrameAccumulator:
+    # Running per pixel sum of frames added in chunks as they arrive
+
+    def __init__(self):
+        self.total = None
+        self.count = 0
+
+    def add(self, frames):
+        chunk = frames.sum(axis=0, dtype=np.float64)
+        if self.total is None:
+            self.total = chunk
+        else:
+            self.total += chunk
+        self.count += len(frames)
+
+    def mean(self):
+        return (self.total / self.count).astype(np.float32)
+
+
+def capture_mean(cam, numpics=100, poll_interval=0.001, timeout=5.0):
+    # Records numpics and averages them while they arrive, then leaves the camera grabbing continuously.
+    # Cover the lens for a dark frame, point at a uniformly lit target for a flat.
+    # Raises RuntimeError if the frames have not arrived timeout seconds after they were due.
+    accumulator = FrameAccumulator()
+    cam.start(numpics)
+    deadline = time.perf_counter() + numpics / cam.settings['framerate'] + timeout
+    added = 0
+    try:
+        while added < numpics:
+            with cam.buffer_lock:
+                last = cam.backend.last_pic_number(cam.mem_handle)
+                if last > added:
+                    accumulator.add(cam.get_frames(added + 1, last + 1))
+            if last > added:
+                added = last
+            elif time.perf_counter() > deadline:
+                raise RuntimeError('Only {} of {} calibration frames arrived'.format(added, numpics))
+            else:
+                time.sleep(poll_interval)
+    finally:
+        cam.stop()
+        cam.start()
+    logging.info('Averaged {} calibration frames'.format(accumulator.count))
+    return accumulator.mean()
+
+
+class FlatFieldCorrector:
+    # Applies dark and optionally flat calibration arrays to (n, height, width) uint8 stacks.
+    # The returned array is a buffer that is reused by the next call from the same thread (preview,
+    # streaming and saving each get their own), copy it to keep it.
+
+    max_gain = 4.0
+    gain_levels = 256  # steps per unit gain before any coarsening to fit max_classes
+
+    def __init__(self, dark, flat=None, max_classes=4096):
+        self.dark = np.asarray(dark, dtype=np.float32)
+        self.flat = None if flat is None else np.asarray(flat, dtype=np.float32)
+        self.shape = self.dark.shape
+        if self.flat is None:
+            gain = np.ones(self.shape, dtype=np.float32)
+        else:
+            signal = np.maximum(self.flat - self.dark, 1)
+            gain = np.clip(signal.mean() / signal, 0, self.max_gain)
+        self.gain = gain.astype(np.float32)
+
+        dark_levels = np.clip(np.round(self.dark), 0, 255).astype(np.int64)
+        levels = self.gain_levels
+        while True:
+            gain_steps = np.round(self.gain * levels).astype(np.int64)
+            keys, classes = np.unique(dark_levels * (int(self.max_gain * levels) + 1) + gain_steps, return_inverse=True)
+            if len(keys) <= max_classes or levels == 1:
+                break
+            levels //= 2
+        class_dark = keys // (int(self.max_gain * levels) + 1)
+        class_gain = (keys % (int(self.max_gain * levels) + 1)) / levels
+        values = (np.arange(256)[np.newaxis] - class_dark[:, np.newaxis]) * class_gain[:, np.newaxis]
+        self.lut = np.clip(np.round(values), 0, 255).astype(np.uint8).ravel()
+        self.offsets = (classes.reshape(self.shape) * 256).astype(np.int32)
+        logging.debug('Flat field table of {} classes at gain step 1/{}'.format(len(keys), levels))
+
+        self._buffers = threading.local()
+
+    def _buffer(self, name, n, dtype):
+        # Per thread buffer of at least n frames, grown when a bigger stack arrives
+        buffer = getattr(self._buffers, name, None)
+        if buffer is None or len(buffer) < n:
+            buffer = np.empty((n,) + self.shape, dtype=dtype)
+            setattr(self._buffers, name, buffer)
+        return buffer[:n]
+
+    def __call__(self, frames):
+        assert frames.shape[1:] == self.shape, 'Calibration is for {} frames, not {}'.format(self.shape, frames.shape[1:])
+        index = self._buffer('index', len(frames), np.int32)
+        out = self._buffer('out', len(frames), np.uint8)
+        np.add(self.offsets, frames, out=index)
+        np.take(self.lut, index, out=out)
+        return out
+
+    def correct_float(self, frames):
+        # Unquantised float32 result for analysis, also a reused buffer
+        out = self._buffer('float', len(frames), np.float32)
+        np.subtract(frames, self.dark, out=out)
+        np.multiply(out, self.gain, out=out)
+        return out
+
+    def save(self, filename):
+        arrays = {'dark': self.dark}
+        if self.flat is not None:
+            arrays['flat'] = self.flat
+        np.savez(filename, **arrays)
+        logging.info('Calibration written to {}'.format(filename))
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            return cls(data['dark'], data['flat'] if 'flat' in data.files else None)
+
+
+def correct_raw(filename, out_filename, corrector, chunk=64):
+    # Writes a corrected copy of a .raw recording
+    reader = RawVideoReader(filename)
+    writer = RawVideoWriter(out_filename, reader.width, reader.height, framerate=reader.framerate,
+                            settings=dict(reader.settings, corrected=True), timestamps=reader.timestamps is not None)
+    for start in range(0, len(reader), chunk):
+        times = None if reader.timestamps is None else reader.timestamps[start:start + chunk]
+        writer.add_frames(corrector(reader.frames[start:start + chunk]), times)
+    writer.close()
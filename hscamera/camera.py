@@ -1,21 +1,27 @@
-import sys
+import os
+import shutil
 import logging
-#test
-sys.path.append("/opt/SiliconSoftware/Runtime5.7.0/SDKWrapper/PythonWrapper/python36/bin")
-sys.path.append("/opt/SiliconSoftware/Runtime5.7.0/SDKWrapper/PythonWrapper/python36/lib")
-sys.path.append("/opt/ConfigFiles")
-sys.path.append("/opt/SiliconSoftware/Runtime5.7.0/lib64")
-
-import SiSoPyInterface as SISO
-import pexpect
+import threading
 
 import time
 
-from labvision.video import WriteVideo
-from labvision.images import gray_to_bgr, load
 import numpy as np
 import json
 
+from backends import SisoBackend
+from buffers import BufferManager, available_memory
+from capabilities import CapabilityTable
+from commands import open_channel
+from instrumentation import AcquisitionMonitor
+from frame_index import FrameIndexWriter, index_filename
+from snapshot import Snapshot
+from save_queue import SaveQueue
+from rawvideo import RawVideoWriter, RawVideoReader
+from reduction import FrameReducer
+from streaming import StreamRecorder
+from parallel_save import save_vid_parallel
+from writers import open_writer
+
 default_settings = {
     'gain': 2,
     'width': 1024,
@@ -33,41 +39,126 @@ default_settings = {
     'y': 0
 }
 
-with open('/opt/ConfigFiles/default_settings.json', 'w') as f:
-    json.dump(default_settings, f)
 
 
+def write_default_settings(filename):
+    with open(filename, 'w') as f:
+        json.dump(default_settings, f)
+
 
 class Camera:
 
     config_dir = '/opt/ConfigFiles/'
     mcf_filename = config_dir + 'current.mcf' # If this file doesn't exist make it using microDisplayX
     filename_base = '~/Videos/'
-
-    def __init__(self, settings_file=None):
-
-        self.settings = self.load_settings(settings_file)
+    # Number of frames handed to the writer at once by save_vid
+    save_chunk = 64
+    # Set to 'json' or 'csv' to write acquisition statistics alongside each recording
+    stats_sidecar = None
+    # Write a frame number / timestamp index (frame_index.py) alongside each recording
+    write_frame_index = True
+    # Fraction of available memory a take may use before save_vid_background dumps it to disk
+    snapshot_memory_fraction = 0.5
+    # Share of free memory left alone when sizing recording buffers
+    memory_margin = 0.25
+    # Size of the ring used for continuous grabbing (preview, streaming and pre-trigger)
+    continuous_buffer_bytes = 4e9
+    # Measured limits for each ROI, made by build_capabilities() (or python capabilities.py)
+    capabilities_file = config_dir + 'capabilities_{}_{}_{}.npz'
+
+    def __init__(self, settings_file=None, backend=None, lazy=False):
+        # backend defaults to the real frame grabber, pass backends.SimulatedBackend() to run off the rig.
+        # With lazy=True the frame grabber is only configured when a buffer is first needed and the
+        # camera link is only opened, and the settings pushed, on the first camera command.
+        self.startup_times = {}
+        if backend is None:
+            backend = self._timed('backend', SisoBackend)
+        self.backend = backend
+
+        default_settings_file = self.config_dir + 'default_settings.json'
+        if os.path.isdir(self.config_dir) and not os.path.exists(default_settings_file):
+            write_default_settings(default_settings_file)
+
+        self.settings = self._timed('load settings', self.load_settings, settings_file)
+
+        self.capabilities = None
+        filename = self._capabilities_filename()
+        if os.path.exists(filename):
+            self.capabilities = self._timed('load capabilities', CapabilityTable.load, filename)
 
         self.ready = False
         self.started = False
-
-        self.no_image = load('no_image.jpg')
-        # Not Really sure why I have both of these lines
-
-        logging.info('Initialising framegrabber with mcf file')
-        self.frame_grabber = SISO.Fg_InitConfig(self.mcf_filename, 0)
-        SISO.Fg_loadConfig(self.frame_grabber, self.mcf_filename)
-
-        self.setup_camera_com()
-
-        self.setup_initial_settings()
+        self.grabber_ready = False
+        self._com = None
+        self._no_image = None
+
+        self.numpics = 0
+        self.mem_handle = None
+        # The grabber allocation is kept between takes and reused when it is big enough
+        self.buffers = BufferManager(self.backend)
+        self.buffer = None
+        # Background readers of the buffer (preview, detection, statistics, pre-trigger copies) hold
+        # buffer_lock while they read and it is taken before the buffer is restarted, reallocated or
+        # freed. buffer_generation counts restarts so a reader can tell its pictures are gone.
+        self.buffer_lock = threading.RLock()
+        self.buffer_generation = 0
+        # Decimation, binning and cropping applied by save_vid and stream_vid
+        self.reduction = FrameReducer()
+        # Software dark / flat field correction (calibration.FlatFieldCorrector) used when saving,
+        # streaming and previewing
+        self.correction = None
+        # Background saving of finished takes, created by save_vid_background on first use
+        self.save_queue = None
+        self.monitor = AcquisitionMonitor(self)
+        self.monitor.start()
+
+        if not lazy:
+            self.setup_grabber()
+            self.connect()
 
         self.ready = True
 
+    def _timed(self, stage, fn, *args):
+        t = time.perf_counter()
+        result = fn(*args)
+        self.startup_times[stage] = time.perf_counter() - t
+        return result
+
+    def log_startup_times(self):
+        breakdown = ', '.join('{} {:.3f} s'.format(stage, t) for stage, t in self.startup_times.items())
+        logging.info('Camera startup: {}'.format(breakdown))
+
+    def setup_grabber(self):
+        if not self.grabber_ready:
+            logging.info('Initialising framegrabber with mcf file')
+            self._timed('frame grabber', self.backend.init_config, self.mcf_filename)
+            self.grabber_ready = True
+            self.log_startup_times()
+
+    def connect(self):
+        if self._com is None:
+            self._timed('camera com', self.setup_camera_com)
+            self._timed('push settings', self.setup_initial_settings)
+            self.log_startup_times()
+
+    @property
+    def com(self):
+        self.connect()
+        return self._com
+
+    @property
+    def no_image(self):
+        if self._no_image is None:
+            # labvision brings in Qt and matplotlib so it is only imported where images are shown
+            from labvision.images import load
+            self._no_image = load('no_image.jpg')
+        return self._no_image
+
     def load_settings(self, filename):
         if filename is None:
             logging.info('Loading default settings')
-            settings = default_settings
+            # Copied so that several cameras do not share one settings dictionary
+            settings = dict(default_settings)
         else:
             logging.info('Loading settings from {}'.format(filename))
             print('name')
@@ -86,62 +177,72 @@ class Camera:
 
     def setup_initial_settings(self):
         logging.info('Setting intial parameters from dictionary')
-        self.set_gain(self.settings['gain'])
-        self.set_fpn_correction(self.settings['fpn_correction'])
-        self.set_width(self.settings['width'])
-        self.set_height(self.settings['height'])
-        self.set_framerate(self.settings['framerate'])
+        self.apply_settings()
+
+    def apply_settings(self, settings=None):
+        # Pushes a settings dictionary with as few commands as possible. The ROI setters are merged
+        # into a single #R and unchanged values are skipped. Exposure is sent after the batch because
+        # its maximum depends on the framerate, and the slope times after it for the same reason.
+        if settings is not None:
+            self.settings.update(settings)
+        with self.com.batch():
+            self.set_gain(self.settings['gain'])
+            self.set_fpn_correction(self.settings['fpn_correction'])
+            self.set_blacklevel(self.settings['blacklevel'])
+            self.set_width(self.settings['width'])
+            self.set_height(self.settings['height'])
+            self.set_x(self.settings['x'])
+            self.set_y(self.settings['y'])
+            self.set_framerate(self.settings['framerate'])
         self.set_exposure(self.settings['exposure'])
-        self.set_blacklevel(self.settings['blacklevel'])
-        self.set_x(self.settings['x'])
-        self.set_y(self.settings['y'])
-        self.set_dualslope_state(self.settings['dualslope'])
-        self.set_dualslope_time(self.settings['dualslope_time'])
-        self.set_tripleslope_state(self.settings['tripleslope'])
-        self.set_tripleslope_time(self.settings['tripleslope_time'])
+        with self.com.batch():
+            self.set_dualslope_state(self.settings['dualslope'])
+            self.set_dualslope_time(self.settings['dualslope_time'])
+            self.set_tripleslope_state(self.settings['tripleslope'])
+            self.set_tripleslope_time(self.settings['tripleslope_time'])
 
     def set_dualslope_state(self, value):
         assert (value == 1) or (value == 0), 'Value must be 0 or 1'
         logging.debug('dualslope set to {}'.format(value))
         self.settings['dualslope'] = value
-        self.send_camera_command('#D{}'.format(value))
+        self.com.set('#D{}'.format(value))
 
     def set_dualslope_time(self, value):
         assert (value >= 1) and (value <= self.settings['exposure']), 'Value must be between 1 and the exposure time'
         logging.debug('dualslope_time set to {}'.format(value))
         self.settings['dualslope_time'] = value
-        self.send_camera_command('#d{}'.format(value))
+        self.com.set('#d{}'.format(value))
 
     def set_tripleslope_state(self, value):
         assert (value == 1) or (value == 0), 'Value must be 0 or 1'
         logging.debug('tripleslope set to {}'.format(value))
         self.settings['tripleslope'] = value
-        self.send_camera_command('#T{}'.format(value))
+        self.com.set('#T{}'.format(value))
 
     def set_tripleslope_time(self, value):
         assert (value >= 1) and (value <= self.settings['dualslope_time']), 'Value must be between 1 and the dualslope time'
         logging.debug('tripleslope_time set to {}'.format(value))
         self.settings['tripleslope_time'] = value
-        self.send_camera_command('#t{}'.format(value))
+        self.com.set('#t{}'.format(value))
 
     def set_blacklevel(self, value):
         assert (value >= 0) and (value <=255), 'Blacklevel must be between 0 and 255'
         logging.debug('blacklevel set to {}'.format(value))
         self.settings['blacklevel'] = value
-        self.send_camera_command('#z('+str(value)+')')
+        self.com.set('#z('+str(value)+')')
 
     def set_fpn_correction(self, value):
         assert value in [0, 1], 'Value must be 0 or 1'
         logging.debug('fpn_correction set to {}'.format(value))
         self.settings['fpn_correction'] = value
-        self.send_camera_command('#F('+str(value)+')')
+        self.com.set('#F('+str(value)+')')
 
     def set_gain(self, value):
         assert value in [1, 1.5, 2, 2.25, 3, 4], 'Value must be in [1, 1.5, 2, 2.25, 3, 4]'
         logging.debug('gain set to {}'.format(value))
         self.settings['gain'] = value
         command = '#G('+str(value)+')'
-        self.send_camera_command(command)
+        self.com.set(command)
 
     def set_exposure(self, value):
         max_exposure = self.get_max_exposure()
@@ -151,135 +252,379 @@ class Camera:
         else:
             self.settings['exposure'] = value
         logging.debug('Exposure set to {}'.format(self.settings['exposure']))
-        self.send_camera_command('#e('+str(self.settings['exposure'])+')')
+        self.com.set('#e('+str(self.settings['exposure'])+')')
 
     def get_max_exposure(self):
-        result = self.send_camera_command('#a', True)
+        if self.capabilities is not None:
+            return self.capabilities.max_exposure(self.settings['framerate'])
+        result = self.com.query('#a')
         return int(result)  # has a byte before and after the number
 
     def get_max_framerate(self):
-        result = self.send_camera_command('#A', True)
+        if self.capabilities is not None:
+            return self.capabilities.max_framerate(self.settings['width'], self.settings['height'])
+        result = self.com.query('#A')
         return int(result)
 
+    def build_capabilities(self):
+        # Measures the limits over every ROI, which takes a while over the serial line, and saves
+        # them so later Camera objects answer get_max_framerate and get_max_exposure without asking
+        self.capabilities = None
+        capabilities = CapabilityTable.build(self)
+        if os.path.isdir(self.config_dir):
+            capabilities.save(self._capabilities_filename())
+        self.capabilities = capabilities
+
+    def plan_roi(self, framerate=None, duration=None):
+        # Suggested width, height and framerate for a target framerate and/or duration in seconds
+        assert self.capabilities is not None, 'Run build_capabilities first'
+        budget = self.buffer_budget()
+        return self.capabilities.plan(lambda width, height: int(budget // (width * height)), framerate, duration)
+
+    def _capabilities_filename(self):
+        return self.capabilities_file.format(type(self.backend).__name__, self.backend.board, self.backend.port)
+
     def set_height(self, height):
         assert (height%2 == 0) and (height <=1024), 'Frame height must be divisible by 2 and at most 1024'
         logging.debug('Height set to {}'.format(height))
         self.settings['height'] = height
-        self.send_camera_command('#R({},{},{},{})'.format(self.settings['x'], self.settings['y'], self.settings['width'], self.settings['height']))
+        self.send_roi()
 
     def set_width(self, width):
         assert (width % 16 == 0) and (width <= 1024), 'Frame height must be divisible by 2 and at most 1024'
         logging.debug('Width set to {}'.format(width))
         self.settings['width'] = width
-        self.send_camera_command('#R({},{},{},{})'.format(self.settings['x'], self.settings['y'], self.settings['width'], self.settings['height']))
+        self.send_roi()
 
     def set_x(self, x):
         logging.debug('x set to {}'.format(x))
         self.settings['x'] = x
-        self.send_camera_command('#R({},{},{},{})'.format(self.settings['x'], self.settings['y'], self.settings['width'], self.settings['height']))
+        self.send_roi()
 
     def set_y(self, y):
         logging.debug('y set to {}'.format(y))
         self.settings['y'] = y
-        self.send_camera_command(
-            '#R({},{},{},{})'.format(self.settings['x'], self.settings['y'], self.settings['width'],
-                                     self.settings['height']))
+        self.send_roi()
+
+    def send_roi(self):
+        self.com.set('#R({},{},{},{})'.format(self.settings['x'], self.settings['y'], self.settings['width'], self.settings['height']))
 
     def set_framerate(self, value):
         logging.debug('framerate set to {}'.format(value))
         self.settings['framerate'] = value
-        self.send_camera_command('#r('+str(value)+')')
+        self.com.set('#r('+str(value)+')')
 
     def setup_camera_com(self):
+        # Sessions are pooled so later Camera objects attach to an open clshell without respawning it.
+        # The camera may have been power cycled or changed from elsewhere since the channel last sent
+        # anything, so its record is refreshed from the values the camera reports. Settings that
+        # already match are then not sent again, ones the camera cannot report always are.
+        self._com = open_channel(self.backend)
+        self._com.read_back(self.backend.settings_queries)
         logging.debug('Camera communication initialised')
-        command = '/opt/SiliconSoftware/Runtime5.7.0/bin/clshell -a -i'
-        self.camera_com = pexpect.spawn(command)
-        for f in range(5):
-            self.camera_com.readline()
 
     def send_camera_command(self, command, expect_return_value=False):
-        self.camera_com.sendline(command.encode())
-        input_line = self.camera_com.readline()
-        if expect_return_value:
-            result = self.camera_com.readline().decode().strip()
-            if result[0] == '>':
-                return result[1:-1]
-            else:
-                return result[:-1]
-        else:
-            result = self.camera_com.readline()
-            return None
+        return self.com.send(command, expect_return_value)
 
-    def get_max_numpics(self):
-        # Maximum buffer size is just over 4GB so make sure buffer is less than 4GB
-        num_bytes_im = self.settings['width'] * self.settings['height']
-        num_ims = int(4e9//num_bytes_im)
+    def get_max_numpics(self, width=None, height=None):
+        if width is None:
+            width, height = self.settings['width'], self.settings['height']
+        num_bytes_im = width * height
+        num_ims = int(self.buffer_budget() // num_bytes_im)
         return num_ims
 
+    def buffer_budget(self):
+        # Bytes a recording buffer may use. Buffers larger than one grabber allocation are made of
+        # segments so this is set by free memory, less memory_margin of it. Memory held by the
+        # current buffer counts as free because it is released before a bigger one is allocated.
+        memory = available_memory()
+        if memory is None:
+            # Without /proc/meminfo stay within a single allocation of just under 4GB
+            return 4e9
+        if self.buffers.buffer is not None:
+            memory += self.buffers.buffer.size
+        return memory * (1 - self.memory_margin)
+
+    def get_max_stream_numpics(self):
+        # Streaming is limited by free disk space rather than the grabber buffer. Pictures dropped by
+        # decimation and pixels removed by binning or cropping are never written so they extend it.
+        height, width = self.reduction.output_shape(self.settings['height'], self.settings['width'])
+        free_bytes = shutil.disk_usage(os.path.expanduser(self.filename_base)).free
+        return int(free_bytes // (width * height)) * self.reduction.decimate
 
     def initialise_buffer(self, numpics=None):
+        self.setup_grabber()
+        frame_size = self.settings['width'] * self.settings['height']
         if numpics is None:
-            numpics = self.get_max_numpics()
-
+            # Continuous grabbing cycles through every sub buffer, so an allocation the frame fits
+            # in is used whole rather than reallocated for the new ROI
+            current = self.buffers.buffer
+            if current is not None and current.subbuffer_size >= frame_size:
+                numpics = current.numpics
+            else:
+                numpics = min(self.get_max_numpics(), int(self.continuous_buffer_bytes // frame_size))
+        self.buffer = self.buffers.acquire(frame_size, numpics, 'acquisition')
+        self.mem_handle = self.buffer.mem_handle
         self.numpics = numpics
-        buffer_size = self.settings['width'] * self.settings['height'] * numpics
-        logging.debug('Initialising buffer of size {} GB'.format(buffer_size/1e9))
-        # Reserves an aera of the main memory as frame buffer, blocks it and makes it available for the user
-        self.mem_handle = SISO.Fg_AllocMemEx(self.frame_grabber, buffer_size, numpics)
         logging.info('Buffer initialised')
 
     def start(self, numpics=None):
-        if self.started:
-            self.stop()
-            self.clear_buffer()
-        if numpics is None:
-            numpics = SISO.GRAB_INFINITE
-            self.initialise_buffer()
-        else:
-            self.initialise_buffer(numpics)
+        self.prepare_start(numpics)
+        self.begin_acquisition()
+
+    def prepare_start(self, numpics=None):
+        # Allocation is the slow part of start so it is separated out, letting several cameras
+        # allocate first and then begin acquiring together
+        with self.buffer_lock:
+            if self.started:
+                self.stop()
+            self.buffer_generation += 1
+            if numpics is None:
+                self.grab_numpics = self.backend.GRAB_INFINITE
+                self.initialise_buffer()
+            else:
+                self.grab_numpics = numpics
+                self.initialise_buffer(numpics)
 
+    def begin_acquisition(self):
         # Starts continuous grabbing in background.
-        err = SISO.Fg_AcquireEx(self.frame_grabber, 0, numpics, SISO.ACQ_STANDARD, self.mem_handle)
+        self.monitor.reset()
+        err = self.backend.acquire(self.grab_numpics, self.mem_handle)
         logging.info('Image acquisition started')
         self.started = True
 
-    def get_current_img(self):
-        index = SISO.Fg_getLastPicNumberEx(self.frame_grabber, 0, self.mem_handle)
+    def get_current_img(self, copy=False, color=False):
+        index = self.backend.last_pic_number(self.mem_handle)
         if index == 0:  # no picture in buffer yet
-            return self.no_image
+            from labvision.images import bgr_to_gray
+            return self.no_image if color else bgr_to_gray(self.no_image)
         else:
-            return self.get_img(index)
-
-    def get_img(self, index):
-        ptr = SISO.Fg_getImagePtrEx(self.frame_grabber, index, 0, self.mem_handle)
-        im = SISO.getArrayFrom(ptr, self.settings['width'], self.settings['height'])
-        return gray_to_bgr(im)
+            return self.get_img(index, copy=copy, color=color)
+
+    def get_img(self, index, copy=False, color=False):
+        # Returns a read only mono view onto the grabber buffer. The view is only valid until the
+        # grabber overwrites that sub buffer so pass copy=True to keep the frame.
+        # color=True returns a new BGR array instead.
+        ptr = self.backend.image_ptr(index, self.mem_handle)
+        im = self.backend.get_array(ptr, self.settings['width'], self.settings['height'])
+        if color:
+            from labvision.images import gray_to_bgr
+            return gray_to_bgr(im)
+        if copy:
+            return np.array(im)
+        im.flags.writeable = False
+        return im
+
+    def get_frames(self, start, stop, copy=False):
+        # Pictures start..stop-1 as an (n, height, width) array. This is a read only view onto the
+        # grabber buffer unless the range wraps around the end of the buffer or crosses from one
+        # segment to the next, which needs a copy.
+        width, height = self.settings['width'], self.settings['height']
+        first_slot = (start - 1) % self.numpics
+        segment = self.buffer.segment_numpics
+        run = min(self.numpics - first_slot, segment - first_slot % segment)
+        if stop - start > run:
+            split = start + run
+            return np.concatenate((self.get_frames(start, split), self.get_frames(split, stop)))
+        frames = self.backend.get_frames(start, stop, width, height, self.mem_handle, self.buffer.subbuffer_size)
+        if copy:
+            return np.array(frames)
+        frames.flags.writeable = False
+        return frames
 
     def stop(self):
-        SISO.Fg_stopAcquire(self.frame_grabber, 0)
-        logging.info('Image acquisition stopped')
-        self.started = False
+        with self.buffer_lock:
+            self.backend.stop()
+            logging.info('Image acquisition stopped')
+            self.started = False
+            self.buffers.release('acquisition')
 
     def clear_buffer(self):
-        SISO.Fg_FreeMemEx(self.frame_grabber, self.mem_handle)
-        logging.info('Memory buffer cleared')
-
-    def save_vid(self, filename=None, signal=None):
-        date_time = self._datetimestr()
+        with self.buffer_lock:
+            self.buffer_generation += 1
+            self.buffers.free()
+            self.buffer = None
+            self.mem_handle = None
+
+    def buffer_stats(self):
+        # Size of the grabber allocation, time spent allocating and the resident size of the process
+        return self.buffers.stats()
+
+    def close(self):
+        # Stops acquisition and frees the grabber buffer, waiting for any background saves first
+        if self.started:
+            self.stop()
+        if self.save_queue is not None:
+            self.save_queue.join()
+        self.monitor.stop()
+        logging.info('Buffer usage: {}'.format(self.buffer_stats()))
+        self.clear_buffer()
+
+    def save_vid(self, filename=None, signal=None, workers=1, start=1, stop=None, restart=True):
+        # Use a .raw filename for the lossless raw container, .hsc for lossless compressed chunks,
+        # otherwise an MP4 is written. With workers > 1 MP4 encoding is split across that many
+        # processes and .hsc chunks are compressed on that many threads.
+        # start and stop select pictures start..stop-1 of the take (default all of it), with
+        # restart=False the buffer is left as it is so another range can be saved from it.
         if filename is None:
-            filename = self.filename_base + str(date_time) + '.MP4'
+            filename = self.default_filename()
+        if stop is None:
+            stop = self.numpics + 1
 
-        writevid = WriteVideo(filename=filename, frame_size=np.shape(self.get_current_img()))
         logging.info('Video writing started')
-        for frame in range(1, self.numpics, 1):
-            if signal is not None:
-                signal(frame)
-            nImg = self.get_img(frame)
-            writevid.add_frame(nImg)
-        writevid.close()
-        logging.info('Video writing finished')
+        index = self._open_frame_index(filename)
+        written = True
+        if workers > 1 and os.path.splitext(filename)[1].lower() not in ('.raw', '.hsc'):
+            written = save_vid_parallel(self, filename, workers=workers, signal=signal, start=start, stop=stop)
+            if index is not None and written:
+                kept = self.reduction.kept_indices(start, stop)
+                index.add_many(kept, self.frame_times(start, stop)[kept - start])
+        else:
+            writer = self._open_writer(filename, workers, reduced=True)
+            for first in range(start, stop, self.save_chunk):
+                last = min(first + self.save_chunk, stop)
+                frames = self.reduction.apply(self.get_frames(first, last), first, correction=self.correction)
+                writer.add_frames(frames)
+                if index is not None:
+                    kept = self.reduction.kept_indices(first, last)
+                    index.add_many(kept, self.frame_times(first, last)[kept - first])
+                self.monitor.record_saved(len(frames), frames.nbytes)
+                if signal is not None:
+                    signal(last - start)
+            writer.close()
+        if written:
+            if index is not None:
+                index.close()
+            logging.info('Video writing finished')
+        else:
+            logging.warning('{} was not written, the index and statistics are left out'.format(filename))
+        logging.info('Acquisition: {}'.format(self.monitor.summary()))
+        if self.stats_sidecar is not None and written:
+            self.monitor.write_sidecar(self._sidecar_filename(filename))
         # self.clear_buffer()
-        self.start()
+        if restart:
+            self.start()
+
+    def stream_vid(self, filename=None, numpics=None, signal=None, cpus=None, start_index=None, fill_dropped=False,
+                   workers=4):
+        # Records continuously into the ring buffer while a StreamRecorder writes frames as they arrive.
+        # Recording length is then limited by disk rather than buffer size. Stop with recorder.stop()
+        # or pass numpics to stop after that many frames. workers is the number of .hsc compression threads.
+        if filename is None:
+            filename = self.default_filename()
+        if not self.started:
+            self.start()
+        writer = self._open_writer(filename, workers, reduced=True)
+        sidecar = None if self.stats_sidecar is None else self._sidecar_filename(filename)
+        recorder = StreamRecorder(self, writer, numpics=numpics, signal=signal, sidecar=sidecar, cpus=cpus,
+                                  fill_dropped=fill_dropped, index=self._open_frame_index(filename, 'host'))
+        recorder.start(start_index)
+        return recorder
+
+    def snapshot(self, start=1, stop=None, reduced=False, spill=None):
+        # Copies pictures start..stop-1 (default the whole buffer) into host memory so the buffer
+        # can be reused while they are saved. reduced applies self.reduction on the way out and
+        # spill names a raw file to dump the frames to instead of holding them in memory.
+        if stop is None:
+            stop = self.numpics + 1
+        time_source = self._time_source()
+        acquisition = {'final': self.monitor.stats(), 'history': list(self.monitor.history)}
+        if not reduced and spill is None:
+            return Snapshot(self.get_frames(start, stop, copy=True), self.frame_times(start, stop), start,
+                            self.settings, time_source=time_source, acquisition=acquisition)
+        times = self.frame_times(start, stop)
+        numbers = np.arange(start, stop)
+        height, width = self.settings['height'], self.settings['width']
+        settings = self.settings
+        if reduced:
+            numbers = self.reduction.kept_indices(start, stop)
+            times = times[numbers - start]
+            height, width = self.reduction.output_shape(height, width)
+            settings = dict(self.settings, reduction=vars(self.reduction))
+        if spill is None:
+            frames = np.empty((len(numbers), height, width), dtype=np.uint8)
+        else:
+            writer = RawVideoWriter(spill, width, height, framerate=self.settings['framerate'], settings=settings)
+        position = 0
+        for chunk_start in range(start, stop, self.save_chunk):
+            chunk = self.get_frames(chunk_start, min(chunk_start + self.save_chunk, stop))
+            if reduced:
+                chunk = self.reduction.apply(chunk, chunk_start, correction=self.correction)
+            if spill is None:
+                frames[position:position + len(chunk)] = chunk
+            else:
+                writer.add_frames(chunk)
+            position += len(chunk)
+        if spill is not None:
+            writer.close()
+            frames = RawVideoReader(spill).frames
+        return Snapshot(frames, times, start, settings, frame_numbers=numbers, spill_file=spill,
+                        time_source=time_source, acquisition=acquisition)
+
+    def save_vid_background(self, filename=None, workers=1, start=1, stop=None, restart=True):
+        # Hands the recorded take to the save queue and re-arms the camera straight away.
+        # The take is copied into memory when it fits comfortably, otherwise dumped to a raw file
+        # next to filename which is removed once the video is saved. start, stop and restart are
+        # as for save_vid.
+        if filename is None:
+            filename = self.default_filename()
+        filename = os.path.expanduser(filename)
+        if self.save_queue is None:
+            self.save_queue = SaveQueue(write_index=self.write_frame_index, monitor=self.monitor)
+        if stop is None:
+            stop = self.numpics + 1
+        height, width = self.reduction.output_shape(self.settings['height'], self.settings['width'])
+        nbytes = len(self.reduction.kept_indices(start, stop)) * height * width
+        memory = available_memory()
+        spill = None
+        if memory is not None and nbytes > self.snapshot_memory_fraction * memory:
+            spill = os.path.splitext(filename)[0] + '_take.raw'
+            logging.info('Take does not fit in memory, dumping it to {}'.format(spill))
+        t = time.perf_counter()
+        snapshot = self.snapshot(start, stop, reduced=True, spill=spill)
+        logging.info('Snapshot of {} frames took {:.2f} s'.format(len(snapshot), time.perf_counter() - t))
+        sidecar = None if self.stats_sidecar is None else self._sidecar_filename(filename)
+        job = self.save_queue.submit(snapshot, filename, workers, sidecar)
+        if restart:
+            self.start()
+        return job
+
+    def frame_times(self, start, stop):
+        # Capture times of pictures start..stop-1 from the grabber, or assuming a perfect
+        # framerate when the grabber cannot provide them
+        times = self.backend.timestamps(start, stop, self.mem_handle)
+        if times is None:
+            times = (np.arange(start, stop) - 1) / self.settings['framerate']
+        return times
+
+    def _time_source(self, fallback='nominal'):
+        # 'grabber' when frame_times comes from grabber timestamps, otherwise fallback
+        if self.backend.timestamps(1, 2, self.mem_handle) is not None:
+            return 'grabber'
+        return fallback
+
+    def _open_frame_index(self, filename, fallback_time_source='nominal'):
+        if not self.write_frame_index:
+            return None
+        return FrameIndexWriter(index_filename(filename), framerate=self.settings['framerate'],
+                                time_source=self._time_source(fallback_time_source))
+
+    def _open_writer(self, filename, workers=4, reduced=False):
+        # reduced sizes the output for frames that have been through self.reduction
+        height, width = self.settings['height'], self.settings['width']
+        settings = self.settings
+        if reduced:
+            height, width = self.reduction.output_shape(height, width)
+            settings = dict(self.settings, reduction=vars(self.reduction))
+        return open_writer(filename, width, height, framerate=self.settings['framerate'], settings=settings,
+                           workers=workers)
+
+    def _sidecar_filename(self, filename):
+        return os.path.splitext(filename)[0] + '_stats.' + self.stats_sidecar
+
+    def default_filename(self, suffix='.MP4'):
+        # Timestamped name in filename_base, with ~ expanded here since the writers do not expand it
+        return os.path.expanduser(self.filename_base) + self._datetimestr() + suffix
 
     def _datetimestr(self):
         now = time.gmtime()
@@ -0,0 +1,111 @@
+import sys
+import time
+import logging
+import argparse
+
+import numpy as np
+
+# The camera's limits are a fixed function of its settings, so they are measured once and looked up
+# afterwards instead of asking the camera with #A / #a on every change.
+#   max framerate  measured for every ROI on the width step 16, height step 2 grid
+#   max exposure   the frame period less a fixed readout overhead, measured over a range of framerates
+# The table is saved with np.savez and indexed directly by width and height.
+
+
+class CapabilityTable:
+
+    width_step = 16
+    height_step = 2
+    max_width = 1024
+    max_height = 1024
+
+    def __init__(self, max_framerates, exposure_overhead):
+        self.max_framerates = max_framerates
+        self.exposure_overhead = exposure_overhead
+
+    @classmethod
+    def build(cls, cam, exposure_samples=20):
+        # Sweeps the ROI grid through the camera link, then restores the camera's settings
+        widths = np.arange(cls.width_step, cls.max_width + 1, cls.width_step)
+        heights = np.arange(cls.height_step, cls.max_height + 1, cls.height_step)
+        max_framerates = np.zeros((len(widths), len(heights)), dtype=np.int64)
+        t = time.perf_counter()
+        for i, width in enumerate(widths):
+            for j, height in enumerate(heights):
+                cam.com.set('#R(0,0,{},{})'.format(width, height))
+                max_framerates[i, j] = int(cam.com.query('#A'))
+            logging.info('Capabilities measured up to width {} ({:.0f} s)'.format(width, time.perf_counter() - t))
+
+        # Smallest ROI so the whole framerate range is reachable
+        cam.com.set('#R(0,0,{},{})'.format(widths[0], heights[0]))
+        overheads = []
+        for framerate in np.geomspace(20, max_framerates[0, 0], exposure_samples).astype(int):
+            cam.com.set('#r({})'.format(framerate))
+            overheads.append(int(1e6 / framerate) - int(cam.com.query('#a')))
+        if max(overheads) - min(overheads) > 2:
+            logging.warning('Exposure overhead varies from {} to {} with framerate'.format(min(overheads), max(overheads)))
+
+        cam.com.invalidate()
+        cam.apply_settings()
+        # The largest overhead seen keeps the looked up maximum exposure on the safe side
+        return cls(max_framerates, max(overheads))
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            return cls(data['max_framerates'], int(data['exposure_overhead']))
+
+    def save(self, filename):
+        np.savez(filename, max_framerates=self.max_framerates, exposure_overhead=self.exposure_overhead)
+        logging.info('Camera capabilities written to {}'.format(filename))
+
+    def max_framerate(self, width, height):
+        return int(self.max_framerates[width // self.width_step - 1, height // self.height_step - 1])
+
+    def max_exposure(self, framerate):
+        return int(1e6 / framerate) - self.exposure_overhead
+
+    def plan(self, max_numpics, framerate=None, duration=None):
+        # Suggests the ROI to record with. max_numpics(width, height) gives the buffer capacity.
+        #   framerate only   the largest ROI that reaches framerate
+        #   duration only    the ROI recording the most frames in duration, running as fast as both
+        #                    the sensor and the buffer allow
+        #   both             the largest ROI that reaches framerate and holds duration seconds of it
+        # Ties go to the larger ROI. Returns None when nothing fits.
+        best, best_key = None, None
+        for i, width in enumerate(range(self.width_step, self.max_width + 1, self.width_step)):
+            for j, height in enumerate(range(self.height_step, self.max_height + 1, self.height_step)):
+                max_framerate = int(self.max_framerates[i, j])
+                numpics = max_numpics(width, height)
+                if framerate is not None:
+                    if max_framerate < framerate:
+                        continue
+                    if duration is not None and numpics < framerate * duration:
+                        continue
+                    rate = framerate
+                elif duration is not None:
+                    rate = max(1, min(max_framerate, int(numpics / duration)))
+                else:
+                    rate = max_framerate
+                frames = numpics if duration is None else min(numpics, int(rate * duration))
+                key = (frames, width * height) if framerate is None and duration is not None else (width * height, frames)
+                if best_key is None or key > best_key:
+                    best_key = key
+                    best = {'width': width, 'height': height, 'framerate': rate, 'frames': frames,
+                            'seconds': frames / rate}
+        return best
+
+
+if __name__ == '__main__':
+    from camera import Camera
+    from backends import SimulatedBackend
+
+    parser = argparse.ArgumentParser(description='Measure and save the camera capability table')
+    parser.add_argument('--settings', default=None)
+    parser.add_argument('--simulate', action='store_true', help='Use the simulated frame grabber')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    cam = Camera(settings_file=args.settings, backend=SimulatedBackend() if args.simulate else None, lazy=True)
+    cam.build_capabilities()
+    sys.exit(0)
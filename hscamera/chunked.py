@@ -0,0 +1,196 @@
+import json
+import struct
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    import lz4.frame as lz4
+except ImportError:
+    lz4 = None
+
+# Lossless chunked storage for mono 8 bit recordings.
+# Frames are grouped into chunks that are prefiltered and compressed independently, so they can be
+# compressed in parallel and any frame can be read by decompressing just its chunk.
+#   file = magic, JSON header, chunk data..., chunk table, JSON footer, footer length, magic
+# Prefilters work in modulo 256 arithmetic so they are exactly invertible:
+#   'delta'      each frame minus the previous one in its chunk, good for mostly static scenes
+#   'background' each frame minus a background image (the mean of the first chunk)
+#   'none'       frames stored as they are
+
+MAGIC = b'HSCCHK01'
+codecs = ('lz4', 'zlib') if lz4 is not None else ('zlib',)
+
+
+def compress(data, codec, level):
+    if codec == 'lz4':
+        return lz4.compress(data, compression_level=level)
+    return zlib.compress(data, level)
+
+
+def decompress(data, codec):
+    if codec == 'lz4':
+        return lz4.decompress(data)
+    return zlib.decompress(data)
+
+
+def prefilter(frames, method, background=None):
+    if method == 'delta':
+        filtered = np.empty_like(frames)
+        filtered[0] = frames[0]
+        np.subtract(frames[1:], frames[:-1], out=filtered[1:])
+        return filtered
+    if method == 'background':
+        return frames - background
+    return frames
+
+
+def unfilter(frames, method, background=None):
+    if method == 'delta':
+        return np.cumsum(frames, axis=0, dtype=np.uint8)
+    if method == 'background':
+        return frames + background
+    return frames
+
+
+def _encode_chunk(frames, method, background, codec, level):
+    return compress(np.ascontiguousarray(prefilter(frames, method, background)), codec, level)
+
+
+class ChunkedWriter:
+
+    def __init__(self, filename, width, height, framerate=0, settings=None, chunk_frames=64, codec=None,
+                 level=1, method='delta', workers=4):
+        self.width = width
+        self.height = height
+        self.chunk_frames = chunk_frames
+        self.codec = codecs[0] if codec is None else codec
+        self.level = level
+        self.method = method
+        self.background = None
+        self.frame_count = 0
+        self.chunks = []
+        self.file = open(filename, 'wb')
+        header = json.dumps({'width': width, 'height': height, 'dtype': '|u1', 'framerate': framerate,
+                             'settings': {} if settings is None else settings, 'chunk_frames': chunk_frames,
+                             'codec': self.codec, 'method': method}).encode()
+        self.file.write(MAGIC + struct.pack('<Q', len(header)) + header)
+
+        self._pending = np.empty((chunk_frames, height, width), dtype=np.uint8)
+        self._filled = 0
+        self._pool = ThreadPoolExecutor(workers)
+        self._futures = []
+        self._max_outstanding = 2 * workers
+
+    def add_frame(self, im):
+        self.add_frames(im[np.newaxis])
+
+    def add_frames(self, frames):
+        # frames are copied into the pending chunk so views onto the grabber buffer are safe to pass
+        position = 0
+        while position < len(frames):
+            n = min(len(frames) - position, self.chunk_frames - self._filled)
+            self._pending[self._filled:self._filled + n] = frames[position:position + n]
+            self._filled += n
+            position += n
+            if self._filled == self.chunk_frames:
+                self._submit()
+
+    def _submit(self):
+        frames = self._pending[:self._filled]
+        if self.method == 'background' and self.background is None:
+            self.background = frames.mean(axis=0).round().astype(np.uint8)
+        future = self._pool.submit(_encode_chunk, frames, self.method, self.background, self.codec, self.level)
+        self._futures.append((future, self._filled))
+        self.frame_count += self._filled
+        self._pending = np.empty_like(self._pending)
+        self._filled = 0
+        while len(self._futures) > self._max_outstanding:
+            self._write_next()
+
+    def _write_next(self):
+        # Chunks are written in order as their compression finishes
+        future, n = self._futures.pop(0)
+        data = future.result()
+        self.chunks.append((self.file.tell(), len(data), n))
+        self.file.write(data)
+
+    def close(self):
+        if self._filled:
+            self._submit()
+        while self._futures:
+            self._write_next()
+        self._pool.shutdown()
+        footer = {'frame_count': self.frame_count, 'table_offset': self.file.tell(), 'chunks': len(self.chunks)}
+        self.file.write(np.asarray(self.chunks, dtype='<u8').reshape((-1, 3)).tobytes())
+        if self.background is not None:
+            footer['background_offset'] = self.file.tell()
+            self.file.write(self.background.tobytes())
+        footer = json.dumps(footer).encode()
+        self.file.write(footer + struct.pack('<Q', len(footer)) + MAGIC)
+        self.file.close()
+
+
+class ChunkedReader:
+
+    def __init__(self, filename, cache_size=4):
+        self.file = open(filename, 'rb')
+        magic, header_length = struct.unpack('<8sQ', self.file.read(16))
+        assert magic == MAGIC, '{} is not a chunked hscamera video'.format(filename)
+        header = json.loads(self.file.read(header_length).decode())
+        self.width = header['width']
+        self.height = header['height']
+        self.framerate = header['framerate']
+        self.settings = header['settings']
+        self.chunk_frames = header['chunk_frames']
+        self.codec = header['codec']
+        self.method = header['method']
+
+        self.file.seek(-16, 2)
+        footer_length, magic = struct.unpack('<Q8s', self.file.read(16))
+        assert magic == MAGIC, '{} is incomplete'.format(filename)
+        self.file.seek(-16 - footer_length, 2)
+        footer = json.loads(self.file.read(footer_length).decode())
+        self.frame_count = footer['frame_count']
+        self.file.seek(footer['table_offset'])
+        self.chunks = np.frombuffer(self.file.read(24 * footer['chunks']), dtype='<u8').reshape((-1, 3))
+        self.background = None
+        if 'background_offset' in footer:
+            self.file.seek(footer['background_offset'])
+            self.background = np.frombuffer(self.file.read(self.width * self.height),
+                                            dtype=np.uint8).reshape((self.height, self.width))
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return self.frame_count
+
+    def read_chunk(self, k):
+        if k in self._cache:
+            self._cache.move_to_end(k)
+            return self._cache[k]
+        offset, nbytes, n = (int(v) for v in self.chunks[k])
+        self.file.seek(offset)
+        data = decompress(self.file.read(nbytes), self.codec)
+        frames = np.frombuffer(data, dtype=np.uint8).reshape((n, self.height, self.width))
+        frames = unfilter(frames, self.method, self.background)
+        frames.flags.writeable = False
+        self._cache[k] = frames
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return frames
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return np.stack([self[i] for i in range(*item.indices(self.frame_count))])
+        if item < 0:
+            item += self.frame_count
+        if not 0 <= item < self.frame_count:
+            raise IndexError('frame {} out of range'.format(item))
+        # Every chunk but the last holds chunk_frames frames
+        return self.read_chunk(item // self.chunk_frames)[item % self.chunk_frames]
+
+    def close(self):
+        self.file.close()
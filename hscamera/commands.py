@@ -0,0 +1,114 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+
+class CommandChannel:
+    # Sits between Camera and the backend's serial line.
+    # Setting commands are keyed by their command code (e.g. '#R' for the ROI) so that inside
+    # batch() repeated changes to the same setting collapse to the last one, and a command
+    # identical to the one last sent for that code is skipped entirely.
+    # Skipping relies on this channel's record of what the camera holds. read_back() fills it in
+    # from the camera's own values, and invalidate() must be called whenever the camera may have
+    # changed behind the channel's back.
+    # Limit queries (#a, #A) are cached until a command that changes them is sent.
+    # Every round trip is timed. The serial line is shared by the gui and background threads (auto
+    # exposure) so each exchange, and a whole batch, holds the channel's lock.
+
+    invalidates_limits = ('#R', '#r')
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.sent = {}
+        self.limits = {}
+        self.timings = {}
+        self._pending = None
+        self._batch_depth = 0
+        self._lock = threading.RLock()
+
+    def send(self, command, expect_return_value=False):
+        with self._lock:
+            t = time.perf_counter()
+            result = self.backend.send_command(command, expect_return_value)
+            duration = time.perf_counter() - t
+            self._record_timing(command[:2], duration)
+        logging.debug('Camera command {} took {:.2f} ms'.format(command, duration * 1e3))
+        return result
+
+    def set(self, command):
+        code = command[:2]
+        with self._lock:
+            if self._pending is not None:
+                self._pending[code] = command
+                return
+            if self.sent.get(code) == command:
+                return
+            self.send(command)
+            self.sent[code] = command
+            if code in self.invalidates_limits:
+                self.limits.clear()
+
+    def query(self, command):
+        with self._lock:
+            if command not in self.limits:
+                self.limits[command] = self.send(command, True)
+            return self.limits[command]
+
+    def invalidate(self):
+        with self._lock:
+            self.sent.clear()
+            self.limits.clear()
+
+    def read_back(self, queries):
+        # Replaces the record of what was sent with the camera's current values. queries maps a
+        # command code to the command asking for it, the reply is the argument list of that code's
+        # setting command. Codes without a query or a reply are forgotten so they are sent again.
+        with self._lock:
+            self.invalidate()
+            for code, query in queries.items():
+                reply = self.send(query, True)
+                if reply:
+                    self.sent[code] = '{}({})'.format(code, reply)
+        logging.debug('Camera reported {}'.format(', '.join(sorted(self.sent.values()))))
+
+    @contextmanager
+    def batch(self):
+        # Commands are sent in the order their code was first used within the batch.
+        # Nested batches join the outermost one, which sends everything when it ends.
+        with self._lock:
+            if self._batch_depth == 0:
+                self._pending = {}
+            self._batch_depth += 1
+            try:
+                yield
+            finally:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    pending, self._pending = self._pending, None
+                    for command in pending.values():
+                        self.set(command)
+
+    def _record_timing(self, code, duration):
+        count, total, longest = self.timings.get(code, (0, 0.0, 0.0))
+        self.timings[code] = (count + 1, total + duration, max(longest, duration))
+
+    def timing_summary(self):
+        return {code: {'count': count, 'mean_ms': 1e3 * total / count, 'max_ms': 1e3 * longest}
+                for code, (count, total, longest) in self.timings.items()}
+
+
+# Open channels keyed by backend.com_key() so that a camera link outlives the Camera using it
+channels = {}
+
+
+def open_channel(backend):
+    key = backend.com_key()
+    channel = channels.get(key)
+    if channel is None or not channel.backend.com_alive():
+        backend.open_com()
+        channel = CommandChannel(backend)
+        channels[key] = channel
+    else:
+        logging.debug('Reusing open camera communication')
+    return channel
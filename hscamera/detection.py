@@ -0,0 +1,166 @@
+import time
+import logging
+import threading
+
+import numpy as np
+
+# Detectors look at a strided view of each frame and return (fired, value).
+# Striding keeps the per frame cost small enough to keep up with the acquisition.
+
+
+class FrameDifferenceDetector:
+    # Mean absolute difference from the previous frame
+
+    def __init__(self, threshold, stride=4):
+        self.threshold = threshold
+        self.stride = stride
+        self.previous = None
+
+    def __call__(self, im):
+        small = im[::self.stride, ::self.stride]
+        if self.previous is None or self.previous.shape != small.shape:
+            self.previous = np.array(small)
+            return False, 0.0
+        energy = float(np.abs(np.subtract(small, self.previous, dtype=np.int16)).mean())
+        self.previous[...] = small
+        return energy > self.threshold, energy
+
+
+class MeanIntensityDetector:
+    # Mean intensity inside roi = (x, y, width, height), fires above (or below) threshold
+
+    def __init__(self, threshold, roi=None, above=True, stride=2):
+        self.threshold = threshold
+        self.roi = roi
+        self.above = above
+        self.stride = stride
+
+    def __call__(self, im):
+        if self.roi is not None:
+            x, y, width, height = self.roi
+            im = im[y:y + height, x:x + width]
+        mean = float(im[::self.stride, ::self.stride].mean())
+        return (mean > self.threshold) if self.above else (mean < self.threshold), mean
+
+
+class MotionPixelDetector:
+    # Number of pixels that changed by more than pixel_threshold since the previous frame
+
+    def __init__(self, pixel_threshold, count_threshold, stride=4):
+        self.pixel_threshold = pixel_threshold
+        self.count_threshold = count_threshold
+        self.stride = stride
+        self.previous = None
+
+    def __call__(self, im):
+        small = im[::self.stride, ::self.stride]
+        if self.previous is None or self.previous.shape != small.shape:
+            self.previous = np.array(small)
+            return False, 0
+        moved = int(np.count_nonzero(np.abs(np.subtract(small, self.previous, dtype=np.int16)) > self.pixel_threshold))
+        self.previous[...] = small
+        return moved > self.count_threshold, moved
+
+
+class DetectionStage:
+    # Runs detectors on the live frame stream on a background thread and calls on_trigger() when
+    # they fire (any of them, or all of them with require_all). Every new picture is examined while
+    # the detectors stay inside budget seconds per frame, otherwise the stage steps over pictures
+    # to keep up with the newest. holdoff seconds must pass before it can fire again.
+
+    poll_interval = 0.0005
+
+    def __init__(self, cam, detectors, on_trigger, budget=None, holdoff=1.0, require_all=False):
+        self.cam = cam
+        self.detectors = detectors
+        self.on_trigger = on_trigger
+        self.budget = budget
+        self.holdoff = holdoff
+        self.require_all = require_all
+
+        self.step = 1
+        self.frames_processed = 0
+        self.frames_skipped = 0
+        self.mean_cost = 0.0
+        self.max_cost = 0.0
+        self.last_values = None
+        self.last_event = None
+
+        self._last_fired = -np.inf
+        self._next_index = None
+        self._generation = None
+        self._running = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {'frames_processed': self.frames_processed, 'frames_skipped': self.frames_skipped,
+                'mean_cost': self.mean_cost, 'max_cost': self.max_cost, 'step': self.step}
+
+    def process(self, index, im):
+        t = time.perf_counter()
+        results = [detector(im) for detector in self.detectors]
+        cost = time.perf_counter() - t
+
+        self.frames_processed += 1
+        self.mean_cost += (cost - self.mean_cost) / min(self.frames_processed, 100)
+        self.max_cost = max(self.max_cost, cost)
+        self.last_values = [value for fired, value in results]
+        if self.budget is not None:
+            # Step over pictures while the detectors cost more than the budget
+            self.step = max(1, int(np.ceil(self.mean_cost / self.budget)))
+
+        fired = [fired for fired, value in results]
+        fired = all(fired) if self.require_all else any(fired)
+        now = time.perf_counter()
+        if fired and now - self._last_fired > self.holdoff:
+            self._last_fired = now
+            self.last_event = {'index': index, 'values': self.last_values, 'time': now}
+            logging.info('Detection fired at frame {} with {}'.format(index, self.last_values))
+            self.on_trigger()
+        return fired
+
+    def _run(self):
+        while self._running.is_set():
+            try:
+                if not self._examine_next():
+                    time.sleep(self.poll_interval)
+            except Exception as error:
+                logging.debug('Detection failed: {}'.format(error))
+                self._next_index = None
+                time.sleep(self.poll_interval)
+
+    def _examine_next(self):
+        # Returns False when there is no new picture to look at. The buffer is held while the
+        # detectors read the frame.
+        with self.cam.buffer_lock:
+            if not self.cam.started:
+                return False
+            if self.cam.buffer_generation != self._generation:
+                # Picture numbers begin again after a restart
+                self._generation = self.cam.buffer_generation
+                self._next_index = None
+            last = self.cam.backend.last_pic_number(self.cam.mem_handle)
+            if self._next_index is None or last < self._next_index - self.step:
+                self._next_index = last
+            if last < self._next_index or last == 0:
+                return False
+            oldest = last - self.cam.numpics + 2
+            if self._next_index < max(oldest, last - 2 * self.step):
+                # Too far behind, jump to the newest picture
+                self.frames_skipped += last - self._next_index
+                self._next_index = last
+            self.process(self._next_index, self.cam.get_img(self._next_index))
+            self.frames_skipped += self.step - 1
+            self._next_index += self.step
+        return True
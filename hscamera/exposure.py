@@ -0,0 +1,153 @@
+import math
+import time
+import logging
+import threading
+
+import numpy as np
+
+# Live image statistics and automatic exposure.
+# Statistics are taken from a strided subsample of the newest frame, with the stride chosen so that
+# no more than max_samples pixels are read whatever the ROI, so each update has a small fixed cost.
+
+
+class FrameStatistics:
+
+    def __init__(self, bins=64, saturation_level=250, max_samples=16384, smoothing=0.5):
+        assert 256 % bins == 0, 'bins must divide 256'
+        self.bins = bins
+        self.shift = int(math.log2(256 // bins))
+        self.saturation_level = saturation_level
+        self.max_samples = max_samples
+        # Weight of the newest frame in the running histogram
+        self.smoothing = smoothing
+
+        self.histogram = np.zeros(bins)
+        self.mean = 0.0
+        self.saturated = 0.0
+        self.cost = 0.0
+        self.frames = 0
+
+    def update(self, im):
+        t = time.perf_counter()
+        stride = max(1, math.ceil(math.sqrt(im.size / self.max_samples)))
+        sample = im[::stride, ::stride]
+        counts = np.bincount((sample >> self.shift).ravel(), minlength=self.bins) / sample.size
+        weight = 1 if self.frames == 0 else self.smoothing
+        self.histogram += weight * (counts - self.histogram)
+        self.mean += weight * (float(sample.mean()) - self.mean)
+        self.saturated += weight * (np.count_nonzero(sample >= self.saturation_level) / sample.size - self.saturated)
+        self.frames += 1
+        self.cost = time.perf_counter() - t
+
+    def percentile(self, q):
+        # Grey level below which q percent of the pixels lie, to the resolution of the histogram
+        cumulative = np.cumsum(self.histogram)
+        return int(np.searchsorted(cumulative, q / 100 * cumulative[-1])) << self.shift
+
+    def summary(self):
+        return 'mean {:.1f}, saturated {:.2%}, p99 {}'.format(self.mean, self.saturated, self.percentile(99))
+
+
+class AutoExposure:
+    # Steers exposure, then gain, to bring the mean level to target while keeping the saturated
+    # fraction below max_saturation. Commands are sent at most once every min_interval seconds and
+    # each step changes exposure by at most max_step times, so the loop settles as new frames arrive.
+    # Exposure stays within the camera's maximum (#a) and above the dual/triple slope times.
+
+    gains = (1, 1.5, 2, 2.25, 3, 4)
+
+    def __init__(self, cam, target=110, max_saturation=0.002, min_interval=0.2, max_step=2.0, tolerance=0.08,
+                 use_gain=True):
+        self.cam = cam
+        self.target = target
+        self.max_saturation = max_saturation
+        self.min_interval = min_interval
+        self.max_step = max_step
+        self.tolerance = tolerance
+        self.use_gain = use_gain
+        self.commands = 0
+        self._last_command = 0
+
+    def step(self, statistics):
+        now = time.perf_counter()
+        if now - self._last_command < self.min_interval:
+            return
+        if statistics.saturated > self.max_saturation:
+            ratio = 1 / self.max_step if statistics.saturated > 10 * self.max_saturation else 0.8
+        else:
+            ratio = self.target / max(statistics.mean, 1)
+            if abs(ratio - 1) < self.tolerance:
+                return
+            ratio = min(max(ratio, 1 / self.max_step), self.max_step)
+        if self._adjust(ratio):
+            self._last_command = now
+            self.commands += 1
+
+    def _adjust(self, ratio):
+        settings = self.cam.settings
+        # A loaded gain may be one this controller does not step through, start from the nearest
+        exposure = settings['exposure']
+        gain = min(self.gains, key=lambda g: abs(g - settings['gain']))
+        if ratio < 1 and self.use_gain and gain > self.gains[0]:
+            # Darker: drop gain before shortening the exposure
+            self.cam.set_gain(self.gains[self.gains.index(gain) - 1])
+            return True
+        max_exposure = self.cam.get_max_exposure()
+        new_exposure = int(min(max(exposure * ratio, self._min_exposure()), max_exposure))
+        if new_exposure == exposure:
+            if ratio > 1 and self.use_gain and gain < self.gains[-1]:
+                # Brighter but already at the longest exposure
+                self.cam.set_gain(self.gains[self.gains.index(gain) + 1])
+                return True
+            return False
+        logging.debug('Auto exposure {} -> {}'.format(exposure, new_exposure))
+        self.cam.set_exposure(new_exposure)
+        return True
+
+    def _min_exposure(self):
+        # set_dualslope_time requires the dual slope time to fit inside the exposure
+        if self.cam.settings['dualslope']:
+            return max(1, self.cam.settings['dualslope_time'])
+        return 1
+
+
+class LiveStatistics:
+    # Updates FrameStatistics from the newest frame every interval seconds on a background thread
+    # and passes them to controller.step() when a controller (AutoExposure) is attached.
+
+    def __init__(self, cam, interval=0.05, statistics=None, controller=None):
+        self.cam = cam
+        self.interval = interval
+        self.statistics = FrameStatistics() if statistics is None else statistics
+        self.controller = controller
+        self._last_index = None
+        self._running = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while self._running.is_set():
+            try:
+                updated = False
+                with self.cam.buffer_lock:
+                    if self.cam.started:
+                        index = self.cam.backend.last_pic_number(self.cam.mem_handle)
+                        if index > 0 and index != self._last_index:
+                            self._last_index = index
+                            self.statistics.update(self.cam.get_img(index))
+                            updated = True
+                if updated and self.controller is not None:
+                    self.controller.step(self.statistics)
+            except Exception as error:
+                logging.debug('Live statistics failed: {}'.format(error))
+            time.sleep(self.interval)
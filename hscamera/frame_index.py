@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+
+# Per recording sidecar with one row per grabber picture covering the recording:
+# picture number, capture time in seconds, whether the frame was dropped and the frame of the
+# video it was written to (-1 if it was not). Stored as a .npz of plain arrays.
+
+
+def index_filename(filename):
+    return os.path.splitext(filename)[0] + '_index.npz'
+
+
+class FrameIndexWriter:
+
+    def __init__(self, filename, framerate=0, time_source='host', chunk=4096):
+        # time_source records whether timestamps come from the 'grabber' or the 'host' clock
+        self.filename = filename
+        self.framerate = framerate
+        self.time_source = time_source
+        self.chunk = chunk
+        self._columns = {'frame_number': [], 'timestamp': [], 'dropped': [], 'video_frame': []}
+        self._pending = ([], [], [], [])
+        self._next_video_frame = 0
+
+    def add(self, frame_number, timestamp, dropped=False, written=True):
+        video_frame = -1
+        if written:
+            video_frame = self._next_video_frame
+            self._next_video_frame += 1
+        for column, value in zip(self._pending, (frame_number, timestamp, dropped, video_frame)):
+            column.append(value)
+        if len(self._pending[0]) >= self.chunk:
+            self._flush()
+
+    def add_many(self, frame_numbers, timestamps, dropped=None):
+        # Bulk rows, all written to consecutive video frames unless dropped
+        self._flush()
+        n = len(frame_numbers)
+        dropped = np.zeros(n, dtype=bool) if dropped is None else np.asarray(dropped, dtype=bool)
+        video_frame = np.full(n, -1, dtype=np.int64)
+        written = ~dropped
+        video_frame[written] = self._next_video_frame + np.arange(np.count_nonzero(written))
+        self._next_video_frame += int(np.count_nonzero(written))
+        for name, values in zip(('frame_number', 'timestamp', 'dropped', 'video_frame'),
+                                (frame_numbers, timestamps, dropped, video_frame)):
+            self._columns[name].append(np.asarray(values))
+
+    def _flush(self):
+        if not self._pending[0]:
+            return
+        for name, values in zip(('frame_number', 'timestamp', 'dropped', 'video_frame'), self._pending):
+            self._columns[name].append(np.asarray(values))
+        self._pending = ([], [], [], [])
+
+    def close(self):
+        self._flush()
+        dtypes = {'frame_number': np.int64, 'timestamp': np.float64, 'dropped': bool, 'video_frame': np.int64}
+        columns = {name: np.concatenate(values).astype(dtypes[name]) if values else np.empty(0, dtypes[name])
+                   for name, values in self._columns.items()}
+        np.savez(self.filename, framerate=self.framerate, time_source=self.time_source, **columns)
+
+
+class FrameIndex:
+
+    def __init__(self, filename):
+        with np.load(filename) as data:
+            self.frame_number = data['frame_number']
+            self.timestamp = data['timestamp']
+            self.dropped = data['dropped']
+            self.video_frame = data['video_frame']
+            self.framerate = float(data['framerate'])
+            self.time_source = str(data['time_source'])
+        # Video frames are numbered consecutively so this maps a video frame straight to its row
+        self._written_rows = np.flatnonzero(self.video_frame >= 0)
+        valid = np.flatnonzero(~np.isnan(self.timestamp))
+        self._first = valid[0] if len(valid) else 0
+        self._last = valid[-1] if len(valid) else 0
+        self.t0 = self.timestamp[self._first] if len(valid) else 0.0
+        span = self.timestamp[self._last] - self.t0 if len(valid) else 0.0
+        # Mean frame interval used to jump straight to the right row
+        self.period = span / (self._last - self._first) if self._last > self._first else 0.0
+
+    def __len__(self):
+        return len(self.frame_number)
+
+    def row_at_time(self, t):
+        # Row of the last frame captured at or before t, relative to the first timestamp.
+        # Rows are guessed from the mean interval and corrected by a short local walk, so regular
+        # recordings are O(1). Irregular ones fall back to a binary search.
+        if self.period == 0:
+            return self._first
+        target = self.t0 + t
+        row = int(np.clip(self._first + (target - self.t0) // self.period, self._first, self._last))
+        for step in range(8):
+            if self.timestamp[row] > target and row > self._first:
+                row -= 1
+            elif row < self._last and self.timestamp[row + 1] <= target:
+                row += 1
+            else:
+                return row
+        valid = ~np.isnan(self.timestamp)
+        rows = np.flatnonzero(valid)
+        position = np.searchsorted(self.timestamp[valid], target, side='right') - 1
+        return int(rows[max(position, 0)])
+
+    def frame_at_time(self, t):
+        # Video frame showing the scene at time t, or -1 if that frame was dropped
+        return int(self.video_frame[self.row_at_time(t)])
+
+    def time_of_frame(self, video_frame):
+        return float(self.timestamp[self._written_rows[video_frame]] - self.t0)
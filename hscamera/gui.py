@@ -1,36 +1,122 @@
 import time
 import logging
 
-from PyQt5.QtWidgets import QMainWindow, QApplication, QHBoxLayout, QVBoxLayout, QWidget, QPushButton, QSlider, QDoubleSpinBox, QComboBox, QProgressBar, QStatusBar, QToolBar, QToolButton, QAction, QFileDialog
+from PyQt5.QtWidgets import QMainWindow, QApplication, QHBoxLayout, QVBoxLayout, QWidget, QPushButton, QSlider, QDoubleSpinBox, QComboBox, QProgressBar, QStatusBar, QToolBar, QToolButton, QAction, QFileDialog, QCheckBox, QLabel, QListWidget
 from PyQt5.QtCore import pyqtSignal, pyqtSlot, Qt
 from PyQt5.QtCore import QTimer, QThread, QObject
 from PyQt5.QtGui import QIcon
 import qtwidgets
+import os
 import sys
 import numpy as np
 from camera import Camera
+from detection import DetectionStage, FrameDifferenceDetector
+from backends import SimulatedBackend
+from pretrigger import PreTriggerRecorder
+from preview import PreviewEngine
+from review import BufferReview
+from calibration import FlatFieldCorrector, capture_mean
+from exposure import AutoExposure, LiveStatistics
+from reduction import FrameReducer
+from labvision.images import gray_to_bgr
 
 
 
 class MainWindow(QMainWindow):
+    detected = pyqtSignal()
+    # Frames averaged for each dark and flat calibration
+    calibration_frames = 100
 
-    def __init__(self):
+    def __init__(self, backend=None):
         super().__init__()
-        self.cam = Camera()
+        self.cam = Camera(backend=backend)
         self.cam.start()
         self.setup_gui()
 
+        self.preview = PreviewEngine(self.cam)
+        self.preview.start()
+
+        # Histogram and levels of the live image, steering exposure when auto exposure is ticked
+        self.live_stats = LiveStatistics(self.cam)
+        self.live_stats.start()
+
+        # Detection runs on its own thread, the signal brings the trigger back onto the gui thread
+        self.detection = None
+        self.detected.connect(self.detection_fired)
+        # Copy thread of the last trigger, triggering stays disabled until it finishes
+        self.capture_thread = None
+        self.review = None
+        self.review_next = False
+        self.record_error = None
+        self.dark = None
+        self.flat = None
+
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_image)
         self.timer.start(30)
 
+        self.stats_timer = QTimer()
+        self.stats_timer.timeout.connect(self.update_stats)
+        self.stats_timer.start(1000)
+
         self.seconds = 10
 
         app.aboutToQuit.connect(self.quit)
 
     def update_image(self):
-        im = self.cam.get_current_img()
-        self.image_viewer.setImage(im)
+        if self.review is not None:
+            return
+        self.preview.target_size = (self.image_viewer.height(), self.image_viewer.width())
+        item = self.preview.take()
+        if item is not None:
+            index, im = item
+            self.image_viewer.setImage(gray_to_bgr(im))
+
+    def update_stats(self):
+        summary = self.cam.monitor.summary()
+        if self.detection is not None:
+            stats = self.detection.stats()
+            summary += ' | detection {:.2f} ms/frame, every {} frames'.format(1e3 * stats['mean_cost'], stats['step'])
+        summary += ' | ' + self.live_stats.statistics.summary()
+        self.stats_label.setText(summary)
+        if self.live_stats.controller is not None:
+            self.show_auto_exposure()
+        self.update_save_list()
+        self.check_capture()
+
+    def update_save_list(self):
+        if self.cam.save_queue is None:
+            return
+        jobs = self.cam.save_queue.status()
+        self.save_list.setVisible(len(jobs) > 0)
+        self.save_list.clear()
+        for job in reversed(jobs):
+            progress = 100 * job['saved'] // max(job['frames'], 1)
+            self.save_list.addItem('{}  {} {}%'.format(os.path.basename(job['filename']), job['status'], progress))
+
+    def detection_changed(self, val):
+        if self.detection is not None:
+            self.detection.stop()
+            self.detection = None
+        if self.detect_checkbox.isChecked():
+            detector = FrameDifferenceDetector(self.detect_threshold_slider.value())
+            # Aim to look at every frame, the stage steps over frames if that costs too much
+            self.detection = DetectionStage(self.cam, [detector], self.detected.emit,
+                                            budget=1 / self.cam.settings['framerate'])
+            self.detection.start()
+        logging.debug('Detection {}'.format('on' if self.detection is not None else 'off'))
+
+    def detection_fired(self):
+        # Ignore detections while a recording, save or triggered capture is already running
+        if self.trigger_button.isEnabled():
+            self.trigger_button_pressed()
+
+    def check_capture(self):
+        if self.capture_thread is not None and not self.capture_thread.is_alive():
+            self.capture_thread = None
+            if self.record_button.isEnabled():
+                self.trigger_button.setEnabled(True)
+                self.status_bar.showMessage('Ready')
 
     def width_changed(self, val):
         logging.debug('Width slider changed to {}'.format(val))
@@ -38,6 +124,7 @@ class MainWindow(QMainWindow):
         self.update_max_framerate()
         self.update_x_max(val)
         self.update_max_seconds()
+        self.update_correction()
 
     def update_x_max(self, width):
         old_val = self.x_slider.value()
@@ -59,6 +146,7 @@ class MainWindow(QMainWindow):
         self.update_max_framerate()
         self.update_y_max(val)
         self.update_max_seconds()
+        self.update_correction()
 
     def x_changed(self, val):
         logging.debug('x slider changed to {}'.format(val))
@@ -124,8 +212,16 @@ class MainWindow(QMainWindow):
         logging.debug('framerate slider maximum set to {}'.format(max_framerate))
         self.framerate_slider.changeSettings(10, max_framerate, 1, framerate)
 
+    def reduction_changed(self, val):
+        logging.debug('reduction changed to decimate {} binning {}'.format(self.decimate_slider.value(), self.binning_slider.value()))
+        self.cam.reduction = FrameReducer(decimate=self.decimate_slider.value(), binning=self.binning_slider.value())
+        self.update_max_seconds()
+
     def update_max_seconds(self):
-        max_num_pics = self.cam.get_max_numpics()
+        if self.stream_checkbox.isChecked():
+            max_num_pics = self.cam.get_max_stream_numpics()
+        else:
+            max_num_pics = self.cam.get_max_numpics()
         max_seconds = max_num_pics / self.cam.settings['framerate']
         logging.debug('seconds slider maximum set to {}'.format(max_seconds))
         self.seconds_slider.changeSettings(1, max_seconds, 1)
@@ -138,17 +234,28 @@ class MainWindow(QMainWindow):
 
         self.lock_options()
 
+        stream = self.stream_checkbox.isChecked()
+        self.review_next = self.review_checkbox.isChecked() and not stream
         self.progress_bar.show()
-        self.progress_bar.setRange(0, seconds)
+        self.progress_bar.setRange(0, -(-images // self.cam.reduction.decimate) if stream else seconds)
         self.progress_bar.setValue(0)
-        self.status_bar.showMessage('Recording...')
+        self.status_bar.showMessage('Streaming to disk...' if stream else 'Recording...')
         logging.info('Recording of {} images starting'.format(images))
-        self.cam.start(images)
+        if not stream:
+            self.cam.start(images)
+        self.start_worker(seconds, images, stream, self.review_next)
+
+    def start_worker(self, seconds, images, stream, review, frames=None):
         self.thread = QThread(self)
 
         self.worker = RecordWorker()
         self.worker.seconds = seconds
+        self.worker.images = images
+        self.worker.stream = stream
+        self.worker.review = review
+        self.worker.frames = frames
         self.worker.filename = None
+        self.worker.workers = self.workers_slider.value()
         self.worker.cam = self.cam
 
         self.worker.moveToThread(self.thread)
@@ -160,13 +267,174 @@ class MainWindow(QMainWindow):
         self.worker.finished.connect(self.worker.deleteLater)
         self.thread.finished.connect(self.thread.deleteLater)
         self.worker.progress.connect(self.progress_bar.setValue)
+        self.worker.failed.connect(self.record_failed)
         self.worker.finished.connect(self.finish_saving)
         self.thread.start()
 
+    def start_review(self):
+        logging.info('Reviewing {} frames in the buffer'.format(self.cam.numpics))
+        self.review = BufferReview(self.cam, display_size=(self.image_viewer.height(), self.image_viewer.width()))
+        self.review.build()
+        self.timeline.setRange(1, self.cam.numpics)
+        self.timeline.setValue(1)
+        self.review_widget.show()
+        self.show_review_frame()
+        self.status_bar.showMessage('Review: choose in and out points then save the range or discard')
+
+    def timeline_changed(self, val):
+        # While dragging only the thumbnail index is used so scrubbing keeps up over long takes
+        if self.timeline.isSliderDown():
+            self.image_viewer.setImage(gray_to_bgr(self.review.thumbnail(val)))
+        else:
+            self.show_review_frame()
+
+    def show_review_frame(self):
+        index = self.timeline.value()
+        self.image_viewer.setImage(gray_to_bgr(self.review.frame(index)))
+        start, stop = self.review.selection()
+        self.review_label.setText('Frame {} of {}, selected {} to {}'.format(index, self.review.numpics, start, stop - 1))
+
+    def in_button_pressed(self):
+        self.review.set_in(self.timeline.value())
+        self.show_review_frame()
+
+    def out_button_pressed(self):
+        self.review.set_out(self.timeline.value())
+        self.show_review_frame()
+
+    def save_range_pressed(self):
+        start, stop = self.review.selection()
+        self.end_review()
+        logging.info('Saving frames {} to {} of the take'.format(start, stop - 1))
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.show()
+        self.start_worker(0, stop - start, False, False, frames=(start, stop))
+
+    def discard_pressed(self):
+        logging.info('Take discarded')
+        self.end_review()
+        self.cam.start()
+        self.finish_saving()
+
+    def end_review(self):
+        self.review.stop()
+        self.review = None
+        self.review_widget.hide()
+
+    def auto_exposure_changed(self, val):
+        if self.auto_exposure_checkbox.isChecked():
+            controller = AutoExposure(self.cam)
+            # Only the whole number gains the gain slider can show
+            controller.gains = (1, 2, 3, 4)
+            self.live_stats.controller = controller
+        else:
+            self.live_stats.controller = None
+        # The controller owns exposure and gain while it runs
+        manual = self.live_stats.controller is None
+        self.exposure_slider.setEnabled(manual)
+        self.gain_slider.setEnabled(manual)
+        self.dualslope_slider.setEnabled(manual)
+        self.tripleslope_slider.setEnabled(manual)
+        if manual and val is not None:
+            # Exposure may have moved while the controller had it
+            self.update_max_dualslope(self.cam.settings['exposure'])
+
+    def show_auto_exposure(self):
+        # Signals are blocked so showing the controller's values does not send them again
+        for slider, key in ((self.exposure_slider, 'exposure'), (self.gain_slider, 'gain')):
+            slider.blockSignals(True)
+            slider.slider.setValue(self.cam.settings[key])
+            slider.value_label.setText(str(self.cam.settings[key]))
+            slider.blockSignals(False)
+
+    def capture_dark_pressed(self):
+        self.start_calibration('dark', 'Capturing dark frames, cover the lens ...')
+
+    def capture_flat_pressed(self):
+        self.start_calibration('flat', 'Capturing flat frames ...')
+
+    def start_calibration(self, kind, message):
+        # The capture restarts the buffer so it runs on a worker with the buffer readers paused
+        self.status_bar.showMessage(message)
+        self.lock_options()
+        self.pause_readers()
+        self.calibration_thread = QThread(self)
+        self.calibration_worker = CalibrationWorker()
+        self.calibration_worker.cam = self.cam
+        self.calibration_worker.kind = kind
+        self.calibration_worker.numpics = self.calibration_frames
+        self.calibration_worker.moveToThread(self.calibration_thread)
+        self.calibration_thread.started.connect(self.calibration_worker.run)
+        self.calibration_worker.captured.connect(self.calibration_captured)
+        self.calibration_worker.failed.connect(self.calibration_failed)
+        self.calibration_worker.finished.connect(self.calibration_thread.quit)
+        self.calibration_worker.finished.connect(self.calibration_worker.deleteLater)
+        self.calibration_thread.finished.connect(self.calibration_thread.deleteLater)
+        self.calibration_worker.finished.connect(self.finish_calibration)
+        self.calibration_thread.start()
+
+    def calibration_captured(self, kind, mean):
+        if kind == 'dark':
+            self.dark = mean
+        else:
+            self.flat = mean
+
+    def calibration_failed(self, message):
+        self.record_error = message
+
+    def finish_calibration(self):
+        self.resume_readers()
+        self.unlock_options()
+        self.update_correction()
+        if self.record_error is not None:
+            self.status_bar.showMessage('Calibration failed: {}'.format(self.record_error))
+            self.record_error = None
+        else:
+            self.status_bar.showMessage('Ready')
+
+    def pause_readers(self):
+        self.preview.stop()
+        self.live_stats.stop()
+        if self.detection is not None:
+            self.detection.stop()
+
+    def resume_readers(self):
+        self.preview.start()
+        self.live_stats.start()
+        if self.detection is not None:
+            self.detection.start()
+
+    def update_correction(self, val=None):
+        # Correction needs a dark frame captured at the current ROI, the flat is optional
+        self.cam.correction = None
+        if not self.correct_checkbox.isChecked() or self.dark is None:
+            return
+        shape = (self.cam.settings['height'], self.cam.settings['width'])
+        if self.dark.shape != shape:
+            self.status_bar.showMessage('Calibration does not match the ROI, capture it again')
+            return
+        flat = self.flat if self.flat is not None and self.flat.shape == shape else None
+        self.cam.correction = FlatFieldCorrector(self.dark, flat)
+        if os.path.isdir(self.cam.config_dir):
+            self.cam.correction.save(self.cam.config_dir + 'calibration.npz')
+
+    def trigger_button_pressed(self):
+        logging.debug('trigger button pressed')
+        # The record time sets the window, split either side of the trigger by the pre-trigger slider
+        images = min(self.seconds_slider.value() * self.framerate_slider.value(), int(0.9 * self.cam.numpics))
+        pre = images * self.pretrigger_slider.value() // 100
+        recorder = PreTriggerRecorder(self.cam, pre, images - pre)
+        self.capture_thread = recorder.trigger()
+        self.trigger_button.setEnabled(False)
+        self.status_bar.showMessage('Triggered, saving {} frames before and {} after'.format(pre, images - pre))
+
     def lock_options(self):
         logging.debug('Sliders locking')
         self.exposure_slider.setEnabled(False)
         self.gain_slider.setEnabled(False)
+        # Exposure is held fixed while recording
+        self.live_stats.controller = None
+        self.auto_exposure_checkbox.setEnabled(False)
         self.fpn_correct_slider.setEnabled(False)
         self.blacklevel_slider.setEnabled(False)
         self.width_slider.setEnabled(False)
@@ -175,12 +443,21 @@ class MainWindow(QMainWindow):
         self.y_slider.setEnabled(False)
         self.framerate_slider.setEnabled(False)
         self.seconds_slider.setEnabled(False)
+        self.stream_checkbox.setEnabled(False)
+        self.review_checkbox.setEnabled(False)
+        self.dark_button.setEnabled(False)
+        self.flat_button.setEnabled(False)
+        self.correct_checkbox.setEnabled(False)
+        self.trigger_button.setEnabled(False)
+        self.workers_slider.setEnabled(False)
+        self.decimate_slider.setEnabled(False)
+        self.binning_slider.setEnabled(False)
         self.record_button.setEnabled(False)
 
     def unlock_options(self):
         logging.debug('Sliders unlocking')
-        self.exposure_slider.setEnabled(True)
-        self.gain_slider.setEnabled(True)
+        self.auto_exposure_checkbox.setEnabled(True)
+        self.auto_exposure_changed(None)
         self.fpn_correct_slider.setEnabled(True)
         self.blacklevel_slider.setEnabled(True)
         self.width_slider.setEnabled(True)
@@ -191,20 +468,44 @@ class MainWindow(QMainWindow):
             self.x_slider.setEnabled(True)
         self.framerate_slider.setEnabled(True)
         self.seconds_slider.setEnabled(True)
+        self.stream_checkbox.setEnabled(True)
+        self.review_checkbox.setEnabled(True)
+        self.dark_button.setEnabled(True)
+        self.flat_button.setEnabled(True)
+        self.correct_checkbox.setEnabled(True)
+        self.trigger_button.setEnabled(self.capture_thread is None)
+        self.workers_slider.setEnabled(True)
+        self.decimate_slider.setEnabled(True)
+        self.binning_slider.setEnabled(True)
         self.record_button.setEnabled(True)
 
     def finish_recording(self):
+        # The worker has already stopped the camera, it may be re-armed by the time this runs
         logging.info('Recording finished')
-        self.cam.stop()
-        self.status_bar.showMessage('Saving Video ...')
-        self.progress_bar.setValue(0)
-        self.progress_bar.setMaximum(self.images)
+        self.status_bar.showMessage('Copying take to the save queue ...')
+
+    def record_failed(self, message):
+        # The take is not reviewed and the camera is re-armed if the error left it stopped
+        self.review_next = False
+        self.record_error = message
+        if not self.cam.started:
+            self.cam.start()
 
     def finish_saving(self):
+        if self.review_next:
+            # The take stays in the buffer for review instead of being saved
+            self.review_next = False
+            self.progress_bar.hide()
+            self.start_review()
+            return
         logging.info('Saving finished')
         self.progress_bar.hide()
         self.unlock_options()
-        self.status_bar.showMessage('Ready')
+        if self.record_error is not None:
+            self.status_bar.showMessage('Recording failed: {}'.format(self.record_error))
+            self.record_error = None
+        else:
+            self.status_bar.showMessage('Ready')
 
 
     def seconds_slider_changed(self, val):
@@ -258,7 +559,7 @@ class MainWindow(QMainWindow):
 
 
         self.image_viewer = qtwidgets.QImageViewer(self)
-        im = self.cam.get_current_img()
+        im = self.cam.get_current_img(color=True)
         self.image_viewer.setImage(im)
 
         layout = QVBoxLayout()
@@ -272,9 +573,35 @@ class MainWindow(QMainWindow):
         self.progress_bar.hide()
         layout.addWidget(self.progress_bar)
 
+        # Timeline and in/out controls shown while reviewing a take in the buffer
+        self.review_widget = QWidget(self)
+        review_layout = QHBoxLayout()
+        self.review_widget.setLayout(review_layout)
+        self.timeline = QSlider(Qt.Horizontal, self)
+        self.timeline.valueChanged.connect(self.timeline_changed)
+        self.timeline.sliderReleased.connect(self.show_review_frame)
+        review_layout.addWidget(self.timeline)
+        self.review_label = QLabel(self)
+        review_layout.addWidget(self.review_label)
+        for text, slot in (('In', self.in_button_pressed), ('Out', self.out_button_pressed),
+                           ('Save range', self.save_range_pressed), ('Discard', self.discard_pressed)):
+            button = QPushButton(text, self)
+            button.released.connect(slot)
+            review_layout.addWidget(button)
+        self.review_widget.hide()
+        layout.addWidget(self.review_widget)
+
+        # Takes waiting for or being saved in the background
+        self.save_list = QListWidget(self)
+        self.save_list.setMaximumHeight(100)
+        self.save_list.hide()
+        layout.addWidget(self.save_list)
+
         self.status_bar = QStatusBar()
         self.status_bar.showMessage('Ready')
         self.setStatusBar(self.status_bar)
+        self.stats_label = QLabel(self)
+        self.status_bar.addPermanentWidget(self.stats_label)
 
         hlayout.addWidget(self.image_viewer)
 
@@ -348,10 +675,64 @@ class MainWindow(QMainWindow):
         self.seconds_slider.settings_button.setVisible(False)
         tool_layout.addWidget(self.seconds_slider)
 
+        self.workers_slider = qtwidgets.QCustomSlider(self, 'Save workers', 1, os.cpu_count(), 1, value_=1, label=True)
+        self.workers_slider.settings_button.setVisible(False)
+        tool_layout.addWidget(self.workers_slider)
+
+        self.decimate_slider = qtwidgets.QCustomSlider(self, 'Keep every nth frame', 1, 100, 1, value_=1, label=True)
+        self.decimate_slider.valueChanged.connect(self.reduction_changed)
+        self.decimate_slider.settings_button.setVisible(False)
+        tool_layout.addWidget(self.decimate_slider)
+
+        self.binning_slider = qtwidgets.QCustomSlider(self, 'Binning', 1, 8, 1, value_=1, label=True)
+        self.binning_slider.valueChanged.connect(self.reduction_changed)
+        self.binning_slider.settings_button.setVisible(False)
+        tool_layout.addWidget(self.binning_slider)
+
+        self.stream_checkbox = QCheckBox('Stream to disk', self)
+        self.stream_checkbox.stateChanged.connect(self.update_max_seconds)
+        tool_layout.addWidget(self.stream_checkbox)
+
+        self.review_checkbox = QCheckBox('Review before saving', self)
+        tool_layout.addWidget(self.review_checkbox)
+
+        self.dark_button = QPushButton('Capture dark', self)
+        self.dark_button.released.connect(self.capture_dark_pressed)
+        tool_layout.addWidget(self.dark_button)
+
+        self.flat_button = QPushButton('Capture flat', self)
+        self.flat_button.released.connect(self.capture_flat_pressed)
+        tool_layout.addWidget(self.flat_button)
+
+        self.auto_exposure_checkbox = QCheckBox('Auto exposure', self)
+        self.auto_exposure_checkbox.stateChanged.connect(self.auto_exposure_changed)
+        tool_layout.addWidget(self.auto_exposure_checkbox)
+
+        self.correct_checkbox = QCheckBox('Flat field correction', self)
+        self.correct_checkbox.stateChanged.connect(self.update_correction)
+        tool_layout.addWidget(self.correct_checkbox)
+
         self.record_button = QPushButton('Record', self)
         self.record_button.released.connect(self.record_button_pressed)
         tool_layout.addWidget(self.record_button)
 
+        self.pretrigger_slider = qtwidgets.QCustomSlider(self, 'Pre-trigger (%)', 0, 100, 1, value_=50, label=True)
+        self.pretrigger_slider.settings_button.setVisible(False)
+        tool_layout.addWidget(self.pretrigger_slider)
+
+        self.trigger_button = QPushButton('Trigger', self)
+        self.trigger_button.released.connect(self.trigger_button_pressed)
+        tool_layout.addWidget(self.trigger_button)
+
+        self.detect_threshold_slider = qtwidgets.QCustomSlider(self, 'Detection threshold', 1, 100, 1, value_=10, label=True)
+        self.detect_threshold_slider.valueChanged.connect(self.detection_changed)
+        self.detect_threshold_slider.settings_button.setVisible(False)
+        tool_layout.addWidget(self.detect_threshold_slider)
+
+        self.detect_checkbox = QCheckBox('Auto trigger', self)
+        self.detect_checkbox.stateChanged.connect(self.detection_changed)
+        tool_layout.addWidget(self.detect_checkbox)
+
         widget = QWidget()
         widget.setLayout(layout)
         self.setCentralWidget(widget)
@@ -361,30 +742,72 @@ class MainWindow(QMainWindow):
 
     def quit(self):
         logging.info('Cleaning up before quitting')
-        self.cam.stop()
-        self.cam.clear_buffer()
+        self.preview.stop()
+        self.live_stats.stop()
+        if self.detection is not None:
+            self.detection.stop()
+        if self.review is not None:
+            self.review.stop()
+        if self.cam.save_queue is not None and self.cam.save_queue.pending():
+            logging.info('Waiting for {} takes to finish saving'.format(self.cam.save_queue.pending()))
+        self.cam.close()
 
 
 class RecordWorker(QObject):
     recorded = pyqtSignal()
     finished = pyqtSignal()
+    failed = pyqtSignal(str)
     progress = pyqtSignal(int)
 
     def run(self):
+        # finished is always emitted so the gui unlocks, failed is emitted before it on an error
+        try:
+            self.record()
+        except Exception as error:
+            logging.exception('Recording failed')
+            self.failed.emit(str(error))
+        self.finished.emit()
+
+    def record(self):
+        if self.stream:
+            recorder = self.cam.stream_vid(self.filename, self.images, self.update_progress)
+            recorder.join()
+            return
         for i in range(self.seconds):
             time.sleep(1)
             self.progress.emit(i+1)
+        # Stopped here rather than from the gui so the stop cannot land after save_vid_background re-arms
+        if self.cam.started:
+            self.cam.stop()
         self.recorded.emit()
-        self.cam.save_vid(self.filename, self.update_progress)
-        self.finished.emit()
+        if not self.review:
+            # The take is saved in the background and the camera re-armed, so the next one can start now
+            start, stop = (1, None) if self.frames is None else self.frames
+            self.cam.save_vid_background(self.filename, self.workers, start, stop)
 
     def update_progress(self, i):
         self.progress.emit(i)
 
 
+class CalibrationWorker(QObject):
+    captured = pyqtSignal(str, object)
+    failed = pyqtSignal(str)
+    finished = pyqtSignal()
+
+    def run(self):
+        try:
+            self.captured.emit(self.kind, capture_mean(self.cam, self.numpics))
+        except Exception as error:
+            logging.exception('Calibration failed')
+            self.failed.emit(str(error))
+        self.finished.emit()
+
+
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
     app = QApplication(sys.argv)
-    main_window = MainWindow()
+    # --simulate runs the gui against the simulated frame grabber
+    backend = SimulatedBackend() if '--simulate' in sys.argv else None
+    main_window = MainWindow(backend)
     main_window.show()
     app.exec_()
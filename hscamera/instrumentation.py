@@ -0,0 +1,178 @@
+import csv
+import json
+import time
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+
+def write_sidecar(filename, settings, final, history):
+    # .csv writes the per second history, anything else a JSON file with the final counters too
+    if filename.lower().endswith('.csv'):
+        rows = list(history) + [final]
+        with open(filename, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(filename, 'w') as f:
+            json.dump({'settings': settings, 'final': final, 'history': list(history)}, f)
+    logging.info('Acquisition statistics written to {}'.format(filename))
+
+
+class AcquisitionMonitor:
+    # Polls the grabber's last picture number on a background thread and keeps running counters
+    # for the current acquisition. Savers report what they write through record_saved and
+    # record_dropped, and streaming consumers report how far they have read through consumed_index
+    # so that buffer_fill is the fraction of the ring still waiting to be saved.
+    # When the grabber provides timestamps, jitter is the spread of the intervals between them and a
+    # gap of more than 1.5 frame periods counts the pictures the grabber missed in grabber_dropped.
+    # Without timestamps neither is measured and jitter is None.
+
+    # Roughly ten hours of once a second history
+    max_history = 36000
+    # Most new pictures whose timestamps are read per poll, older ones in a longer run are not checked
+    max_timestamps = 4096
+
+    def __init__(self, cam, poll_interval=0.01, log_interval=10, history_interval=1):
+        self.cam = cam
+        self.poll_interval = poll_interval
+        self.log_interval = log_interval
+        self.history_interval = history_interval
+        self._running = threading.Event()
+        self._thread = None
+        self.reset()
+
+    def reset(self, baseline=0):
+        # baseline is the picture number already in the buffer when counting starts
+        self.frames_acquired = 0
+        self.frames_dropped = 0
+        self.consumed_index = None
+        self.grabber_dropped = 0
+        self.fps = 0.0
+        self.jitter = None
+        self.buffer_fill = 0.0
+        self.saved_frames = 0
+        self.saved_bytes = 0
+        self.save_fps = 0.0
+        self.save_mbps = 0.0
+        self.history = deque(maxlen=self.max_history)
+        self._save_start = None
+        self._last_index = baseline
+        self._last_timestamp = None
+        self._samples = deque()
+        self._intervals = deque(maxlen=4096)
+        self._last_log = time.perf_counter()
+        self._last_history = time.perf_counter()
+        self._start_time = time.perf_counter()
+
+    def start(self):
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def record_saved(self, frames, nbytes):
+        now = time.perf_counter()
+        if self._save_start is None:
+            self._save_start = now
+        self.saved_frames += frames
+        self.saved_bytes += nbytes
+        elapsed = now - self._save_start
+        if elapsed > 0:
+            self.save_fps = self.saved_frames / elapsed
+            self.save_mbps = self.saved_bytes / elapsed / 1e6
+
+    def record_dropped(self, frames):
+        self.frames_dropped += frames
+
+    def stats(self):
+        return {'time': time.perf_counter() - self._start_time,
+                'frames_acquired': self.frames_acquired,
+                'frames_dropped': self.frames_dropped,
+                'grabber_dropped': self.grabber_dropped,
+                'fps': self.fps,
+                'jitter': self.jitter,
+                'buffer_fill': self.buffer_fill,
+                'saved_frames': self.saved_frames,
+                'save_fps': self.save_fps,
+                'save_mbps': self.save_mbps}
+
+    def summary(self):
+        jitter = '' if self.jitter is None else ' | jitter {:.1f} us'.format(self.jitter * 1e6)
+        return 'fps {:.1f}{} | dropped {} | grabber dropped {} | buffer {:.0f}% | save {:.1f} MB/s'.format(
+            self.fps, jitter, self.frames_dropped, self.grabber_dropped, 100 * self.buffer_fill, self.save_mbps)
+
+    def write_sidecar(self, filename):
+        write_sidecar(filename, self.cam.settings, self.stats(), list(self.history))
+
+    def _sample(self):
+        with self.cam.buffer_lock:
+            if not self.cam.started:
+                return
+            index = self.cam.backend.last_pic_number(self.cam.mem_handle)
+            if index < self._last_index:
+                # The buffer was restarted, picture numbers begin again
+                self._last_index = 0
+                self._last_timestamp = None
+            times = None
+            if index > self._last_index:
+                first = max(self._last_index + 1, index - min(self.max_timestamps, self.cam.numpics - 1) + 1)
+                if first > self._last_index + 1:
+                    self._last_timestamp = None
+                times = self.cam.backend.timestamps(first, index + 1, self.cam.mem_handle)
+        now = time.perf_counter()
+        if times is not None:
+            self._check_timestamps(times)
+        self.frames_acquired += index - self._last_index
+        self._last_index = index
+
+        self._samples.append((now, index))
+        while len(self._samples) > 2 and now - self._samples[0][0] > 1:
+            self._samples.popleft()
+        t0, i0 = self._samples[0]
+        if now > t0:
+            self.fps = (index - i0) / (now - t0)
+
+        consumed = 0 if self.consumed_index is None else self.consumed_index
+        if self.consumed_index is None and self.cam.numpics and index > self.cam.numpics:
+            # Free running ring with nothing consuming it
+            consumed = index - self.cam.numpics
+        self.buffer_fill = min(1.0, max(0, index - consumed) / self.cam.numpics)
+
+    def _check_timestamps(self, times):
+        if self._last_timestamp is not None:
+            times = np.concatenate(([self._last_timestamp], times))
+        self._last_timestamp = times[-1]
+        intervals = np.diff(times)
+        period = 1 / self.cam.settings['framerate']
+        gaps = intervals > 1.5 * period
+        if gaps.any():
+            missed = int(np.round(intervals[gaps] / period).sum()) - int(np.count_nonzero(gaps))
+            self.grabber_dropped += missed
+            logging.debug('Grabber timestamps show {} missed frames'.format(missed))
+        self._intervals.extend(intervals[~gaps])
+        if len(self._intervals) > 1:
+            self.jitter = float(np.std(self._intervals))
+
+    def _run(self):
+        while self._running.is_set():
+            try:
+                self._sample()
+            except Exception as error:
+                logging.debug('Acquisition monitor sample failed: {}'.format(error))
+            now = time.perf_counter()
+            if now - self._last_history > self.history_interval:
+                self.history.append(self.stats())
+                self._last_history = now
+            if now - self._last_log > self.log_interval:
+                logging.info('Acquisition: {}'.format(self.summary()))
+                self._last_log = now
+            time.sleep(self.poll_interval)
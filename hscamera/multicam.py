@@ -0,0 +1,82 @@
+import os
+import json
+import logging
+
+from backends import SisoBackend, SimulatedBackend
+from camera import Camera
+
+
+class MultiCameraManager:
+    # Owns several cameras, each on its own board/DMA port with its own buffer, and records them
+    # together. Every camera streams through its own reader and writer threads pinned to a separate
+    # group of cores so throughput scales with the number of cameras. Recordings start from picture
+    # numbers snapshotted back to back and dropped frames are filled, so frame k of every output
+    # belongs to the same trigger when the cameras share a hardware trigger. The start picture of
+    # each camera is written to a _sync.json file next to the outputs.
+
+    def __init__(self, cameras):
+        self.cameras = cameras
+        self.recorders = []
+
+    @classmethod
+    def from_ports(cls, ports, settings_files=None, simulate=False, clshell_commands=None):
+        # ports is a list of (board, port) pairs. Each camera's serial line is opened with a clshell
+        # command built from its board and port unless clshell_commands lists them explicitly.
+        cameras = []
+        for i, (board, port) in enumerate(ports):
+            if simulate:
+                backend = SimulatedBackend(board=board, port=port)
+            else:
+                clshell_command = None if clshell_commands is None else clshell_commands[i]
+                backend = SisoBackend(board=board, port=port, clshell_command=clshell_command)
+            settings_file = None if settings_files is None else settings_files[i]
+            cameras.append(Camera(settings_file, backend=backend))
+        return cls(cameras)
+
+    def start(self):
+        for cam in self.cameras:
+            cam.prepare_start()
+        for cam in self.cameras:
+            cam.begin_acquisition()
+        logging.info('Acquisition started on {} cameras'.format(len(self.cameras)))
+
+    def cpu_sets(self):
+        cpus = sorted(os.sched_getaffinity(0))
+        n = len(self.cameras)
+        return [set(cpus[i * len(cpus) // n:(i + 1) * len(cpus) // n]) or set(cpus) for i in range(n)]
+
+    def record(self, filename_base, numpics=None, extension='.raw'):
+        if not all(cam.started for cam in self.cameras):
+            self.start()
+        starts = [cam.backend.last_pic_number(cam.mem_handle) + 1 for cam in self.cameras]
+        filenames = ['{}_cam{}{}'.format(filename_base, i, extension) for i in range(len(self.cameras))]
+        self.recorders = [cam.stream_vid(filename, numpics=numpics, cpus=cpus, start_index=start, fill_dropped=True)
+                          for cam, filename, cpus, start in zip(self.cameras, filenames, self.cpu_sets(), starts)]
+
+        sync = {'numpics': numpics,
+                'cameras': [{'board': cam.backend.board, 'port': cam.backend.port, 'filename': filename,
+                             'start_index': start, 'settings': cam.settings}
+                            for cam, filename, start in zip(self.cameras, filenames, starts)]}
+        with open(filename_base + '_sync.json', 'w') as f:
+            json.dump(sync, f)
+        return self.recorders
+
+    def stop_recording(self):
+        for recorder in self.recorders:
+            recorder.stop()
+        self.join()
+
+    def join(self):
+        for recorder in self.recorders:
+            recorder.join()
+        dropped = [recorder.dropped for recorder in self.recorders]
+        logging.info('Multi camera recording finished, dropped frames per camera {}'.format(dropped))
+        return dropped
+
+    def stop(self):
+        for cam in self.cameras:
+            cam.stop()
+
+    def close(self):
+        for cam in self.cameras:
+            cam.close()
@@ -0,0 +1,122 @@
+import os
+import shutil
+import logging
+import subprocess
+import multiprocessing
+
+from rawvideo import RawVideoReader
+from writers import open_writer
+
+# Encodes a buffered recording on several cores. The buffer is first dumped to a raw
+# container at disk speed, then each worker process memory maps the dump and encodes
+# its own contiguous range of frames into a numbered segment. The segments are joined
+# with ffmpeg when it is available, otherwise the numbered segment set is kept.
+
+_frames_done = None
+progress_interval = 16
+
+
+def _init_worker(counter):
+    global _frames_done
+    _frames_done = counter
+
+
+def _encode_segment(args):
+    raw_filename, start, stop, segment_filename = args
+    reader = RawVideoReader(raw_filename)
+    writer = open_writer(segment_filename, reader.width, reader.height, framerate=reader.framerate,
+                         settings=reader.settings)
+    for chunk in range(start, stop, progress_interval):
+        chunk_stop = min(chunk + progress_interval, stop)
+        writer.add_frames(reader.frames[chunk:chunk_stop])
+        with _frames_done.get_lock():
+            _frames_done.value += chunk_stop - chunk
+    writer.close()
+    return segment_filename
+
+
+def segment_filenames(filename, n):
+    base, extension = os.path.splitext(filename)
+    return ['{}_{:03d}{}'.format(base, i, extension) for i in range(n)]
+
+
+def concatenate_segments(segments, filename):
+    if shutil.which('ffmpeg') is None:
+        logging.warning('ffmpeg not found, keeping numbered segments {} ... {}'.format(segments[0], segments[-1]))
+        return False
+    list_filename = filename + '.segments.txt'
+    with open(list_filename, 'w') as f:
+        for segment in segments:
+            f.write("file '{}'\n".format(os.path.abspath(segment)))
+    try:
+        result = subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                                 '-i', list_filename, '-c', 'copy', filename])
+    finally:
+        os.remove(list_filename)
+    if result.returncode != 0:
+        logging.warning('ffmpeg concatenation failed, keeping numbered segments')
+        if os.path.exists(filename):
+            os.remove(filename)
+        return False
+    for segment in segments:
+        os.remove(segment)
+    return True
+
+
+def encode_parallel(raw_filename, filename, workers=None, signal=None, keep_segments=False):
+    # Encodes a raw container into filename on workers processes, signal gets the frames encoded so
+    # far. Returns True once filename has been written, False if the numbered segments were kept
+    # instead. Segments of a failed encode are removed.
+    if workers is None:
+        workers = os.cpu_count()
+    numpics = len(RawVideoReader(raw_filename))
+    workers = max(1, min(workers, numpics))
+
+    segments = segment_filenames(filename, workers)
+    bounds = [numpics * i // workers for i in range(workers + 1)]
+    jobs = [(raw_filename, bounds[i], bounds[i + 1], segments[i]) for i in range(workers)]
+
+    logging.info('Encoding {} frames with {} workers'.format(numpics, workers))
+    counter = multiprocessing.Value('q', 0)
+    try:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(counter,)) as pool:
+            result = pool.map_async(_encode_segment, jobs)
+            while not result.ready():
+                result.wait(0.2)
+                if signal is not None:
+                    signal(counter.value)
+            result.get()
+    except BaseException:
+        for segment in segments:
+            if os.path.exists(segment):
+                os.remove(segment)
+        raise
+
+    if keep_segments:
+        return False
+    return concatenate_segments(segments, filename)
+
+
+def save_vid_parallel(cam, filename, workers=None, signal=None, keep_segments=False, start=1, stop=None):
+    # Saves pictures start..stop-1 of the take, by default all of it, and returns True once filename
+    # has been written. The dump and the encode each count for half of the frames passed to signal.
+    if stop is None:
+        stop = cam.numpics + 1
+    total = len(cam.reduction.kept_indices(start, stop))
+    raw_filename = filename + '.dump.raw'
+    logging.info('Dumping buffer to {}'.format(raw_filename))
+    try:
+        dump = cam._open_writer(raw_filename, reduced=True)
+        for first in range(start, stop, cam.save_chunk):
+            frames = cam.get_frames(first, min(first + cam.save_chunk, stop))
+            dump.add_frames(cam.reduction.apply(frames, first, correction=cam.correction))
+            if signal is not None:
+                signal(dump.frame_count // 2)
+        dump.close()
+        progress = None if signal is None else lambda encoded: signal((total + encoded) // 2)
+        written = encode_parallel(raw_filename, filename, workers, progress, keep_segments)
+    finally:
+        if os.path.exists(raw_filename):
+            os.remove(raw_filename)
+    cam.monitor.record_saved(dump.frame_count, dump.frame_count * dump.width * dump.height)
+    return written
@@ -0,0 +1,110 @@
+import os
+import time
+import logging
+import threading
+
+import numpy as np
+
+
+class PreTriggerRecorder:
+    # The grabber runs continuously into its ring buffer. trigger() notes the current picture and,
+    # once post_frames more pictures have arrived, the window from pre_frames before the trigger to
+    # post_frames after it is copied out of the ring and handed to a saver thread. Acquisition is
+    # never stopped so further triggers can follow straight away.
+
+    poll_interval = 0.001
+    copy_chunk = 256
+    # Seconds to wait beyond the expected end of the window before a capture is abandoned
+    timeout = 5.0
+
+    def __init__(self, cam, pre_frames, post_frames, filename_base=None):
+        if not cam.started:
+            cam.start()
+        # Leave some of the ring free so the oldest frames survive while the window is copied
+        assert pre_frames + post_frames <= 0.9 * cam.numpics, 'Pre and post trigger window must fit in the buffer'
+        self.cam = cam
+        self.pre_frames = pre_frames
+        self.post_frames = post_frames
+        self.filename_base = os.path.expanduser(cam.filename_base if filename_base is None else filename_base)
+        self.captures = []
+
+    def trigger(self, filename=None):
+        with self.cam.buffer_lock:
+            trigger_index = self.cam.backend.last_pic_number(self.cam.mem_handle)
+            generation = self.cam.buffer_generation
+        if filename is None:
+            filename = self.filename_base + self.cam._datetimestr() + '_trigger.MP4'
+        logging.info('Triggered at frame {}'.format(trigger_index))
+        thread = threading.Thread(target=self._capture, args=(trigger_index, generation, filename), daemon=True)
+        thread.start()
+        self.captures.append(thread)
+        return thread
+
+    def _buffer_valid(self, generation):
+        # Recording, calibration or a restart reallocate or stop the ring under a capture
+        return self.cam.started and self.cam.buffer_generation == generation
+
+    def _capture(self, trigger_index, generation, filename):
+        cam = self.cam
+        backend = cam.backend
+        mem_handle = cam.mem_handle
+        first = max(1, trigger_index - self.pre_frames + 1)
+        stop = trigger_index + self.post_frames + 1
+        deadline = time.perf_counter() + self.post_frames / cam.settings['framerate'] + self.timeout
+        while True:
+            with cam.buffer_lock:
+                if not self._buffer_valid(generation):
+                    logging.error('Acquisition stopped before the frames after the trigger at {} arrived, nothing saved'.format(trigger_index))
+                    return
+                if backend.last_pic_number(mem_handle) >= stop - 1:
+                    break
+            if time.perf_counter() > deadline:
+                logging.error('Timed out waiting for the frames after the trigger at {}, nothing saved'.format(trigger_index))
+                return
+            time.sleep(self.poll_interval)
+
+        # Pictures are reduced and corrected as they are copied. A picture the grabber overwrote
+        # before or during its copy is recorded as dropped in the index rather than written.
+        frames = []
+        numbers = []
+        times = []
+        dropped = []
+        for start in range(first, stop, self.copy_chunk):
+            chunk_stop = min(start + self.copy_chunk, stop)
+            kept = cam.reduction.kept_indices(start, chunk_stop, first)
+            chunk_times = np.full(len(kept), np.nan)
+            # The buffer is held for one chunk at a time so a restart waits at most that long
+            with cam.buffer_lock:
+                if not self._buffer_valid(generation):
+                    logging.error('Buffer was restarted while copying the trigger at {}, nothing saved'.format(trigger_index))
+                    return
+                oldest = backend.last_pic_number(mem_handle) - cam.numpics + 2
+                valid = kept >= oldest
+                if valid.any():
+                    copy_start = max(start, oldest)
+                    chunk = cam.reduction.apply(cam.get_frames(copy_start, chunk_stop), copy_start, first,
+                                                correction=cam.correction)
+                    chunk = np.array(chunk)
+                    chunk_times[valid] = cam.frame_times(copy_start, chunk_stop)[kept[valid] - copy_start]
+                    # The grabber may have lapped the copy
+                    oldest = backend.last_pic_number(mem_handle) - cam.numpics + 2
+                    survived = kept[valid] >= oldest
+                    frames.append(chunk[survived])
+                    valid[valid] = survived
+                    chunk_times[~valid] = np.nan
+            numbers.append(kept)
+            times.append(chunk_times)
+            dropped.append(~valid)
+        numbers, times, dropped = np.concatenate(numbers), np.concatenate(times), np.concatenate(dropped)
+        if dropped.any():
+            logging.warning('{} frames around the trigger were overwritten before they could be copied'.format(np.count_nonzero(dropped)))
+
+        writer = cam._open_writer(filename, reduced=True)
+        for chunk in frames:
+            writer.add_frames(chunk)
+        writer.close()
+        index = cam._open_frame_index(filename)
+        if index is not None:
+            index.add_many(numbers, times, dropped)
+            index.close()
+        logging.info('Saved frames {} to {} around trigger at {} to {}'.format(first, stop - 1, trigger_index, filename))
@@ -0,0 +1,115 @@
+import math
+import time
+import logging
+import threading
+
+import numpy as np
+
+
+class Mailbox:
+    # Single slot hand over between threads, a new item replaces any that has not been taken yet
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._item = None
+
+    def put(self, item):
+        with self._lock:
+            self._item = item
+
+    def take(self):
+        with self._lock:
+            item, self._item = self._item, None
+        return item
+
+
+def bin_image(im, factor):
+    # Block average of factor x factor pixels, any ragged edge is dropped
+    if factor == 1:
+        return np.array(im)
+    height = im.shape[0] // factor * factor
+    width = im.shape[1] // factor * factor
+    blocks = im[:height, :width].reshape(height // factor, factor, width // factor, factor)
+    return (blocks.sum(axis=(1, 3), dtype=np.uint32) // (factor * factor)).astype(np.uint8)
+
+
+class PreviewEngine:
+    # Fetches only the newest frame on a background thread, bins it down to the display size and
+    # publishes it through a Mailbox so the GUI thread only ever draws a small image. The fetch
+    # interval backs off so the preview uses at most max_load of a core, which keeps display cost
+    # independent of acquisition framerate and ROI.
+
+    def __init__(self, cam, target_size=(512, 512), max_fps=30, max_load=0.25):
+        self.cam = cam
+        self.target_size = target_size
+        self.max_fps = max_fps
+        self.max_load = max_load
+        self.mailbox = Mailbox()
+
+        self.fps = 0.0
+        self.latency = 0.0
+        self.cost = 0.0
+        self._last_index = None
+        self._published = 0
+        self._window_start = time.perf_counter()
+
+        self._running = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def take(self):
+        # Returns (picture number, binned image) or None if nothing new has been published
+        item = self.mailbox.take()
+        if item is None:
+            return None
+        index, im, fetched = item
+        self.latency = time.perf_counter() - fetched
+        return index, im
+
+    def _binning_factor(self, height, width):
+        target_height, target_width = self.target_size
+        return max(1, math.ceil(max(height / max(target_height, 1), width / max(target_width, 1))))
+
+    def _fetch(self):
+        # bin_image copies so the buffer is only held while the frame is read
+        with self.cam.buffer_lock:
+            if not self.cam.started:
+                return
+            index = self.cam.backend.last_pic_number(self.cam.mem_handle)
+            if index == 0 or index == self._last_index:
+                return
+            im = self.cam.get_img(index)
+            if self.cam.correction is not None:
+                im = self.cam.correction(im[np.newaxis])[0]
+            small = bin_image(im, self._binning_factor(*im.shape))
+        self.mailbox.put((index, small, time.perf_counter()))
+        self._last_index = index
+        self._published += 1
+
+    def _run(self):
+        while self._running.is_set():
+            t = time.perf_counter()
+            try:
+                self._fetch()
+            except Exception as error:
+                logging.debug('Preview fetch failed: {}'.format(error))
+            self.cost = time.perf_counter() - t
+
+            elapsed = time.perf_counter() - self._window_start
+            if elapsed > 1:
+                self.fps = self._published / elapsed
+                self._published = 0
+                self._window_start = time.perf_counter()
+
+            interval = max(1 / self.max_fps, self.cost / self.max_load)
+            time.sleep(max(interval - self.cost, 0))
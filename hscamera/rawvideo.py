@@ -0,0 +1,99 @@
+import json
+import struct
+
+import numpy as np
+
+# Lossless container for mono frames.
+# A fixed size header (padded to header_size so frame data is page aligned) holds
+# the frame geometry, dtype, framerate, frame count and the camera settings as JSON.
+# Frames follow contiguously, then an optional float64 timestamp per frame.
+
+MAGIC = b'HSCRAW01'
+HEADER_SIZE = 4096
+# magic, width, height, dtype, framerate, frame count, timestamp table offset, settings length
+HEADER_FORMAT = '<8sII8sdQQI'
+
+
+class RawVideoWriter:
+
+    def __init__(self, filename, width, height, framerate=0, settings=None, dtype=np.uint8, timestamps=False):
+        self.filename = filename
+        self.width = width
+        self.height = height
+        self.framerate = framerate
+        self.settings = {} if settings is None else settings
+        self.dtype = np.dtype(dtype)
+        self.frame_count = 0
+        self.timestamps = [] if timestamps else None
+        self.file = open(filename, 'wb')
+        self._write_header(0)
+
+    def _write_header(self, timestamp_offset):
+        settings = json.dumps(self.settings).encode()
+        header = struct.pack(HEADER_FORMAT, MAGIC, self.width, self.height, self.dtype.str.encode(),
+                             self.framerate, self.frame_count, timestamp_offset, len(settings))
+        assert len(header) + len(settings) <= HEADER_SIZE, 'Settings too large for raw video header'
+        self.file.seek(0)
+        self.file.write(header + settings)
+        self.file.write(bytes(HEADER_SIZE - len(header) - len(settings)))
+
+    def add_frame(self, im, timestamp=None):
+        assert im.shape == (self.height, self.width), 'Frame shape does not match the video'
+        self.file.write(np.ascontiguousarray(im, dtype=self.dtype))
+        self.frame_count += 1
+        if self.timestamps is not None:
+            self.timestamps.append(np.nan if timestamp is None else timestamp)
+
+    def add_frames(self, frames, timestamps=None):
+        # frames is an (n, height, width) array, typically a view straight onto the grabber buffer
+        assert frames.shape[1:] == (self.height, self.width), 'Frame shape does not match the video'
+        self.file.write(np.ascontiguousarray(frames, dtype=self.dtype))
+        self.frame_count += len(frames)
+        if self.timestamps is not None:
+            if timestamps is None:
+                timestamps = np.full(len(frames), np.nan)
+            self.timestamps.extend(timestamps)
+
+    def close(self):
+        timestamp_offset = 0
+        if self.timestamps is not None:
+            timestamp_offset = self.file.tell()
+            self.file.write(np.asarray(self.timestamps, dtype='<f8'))
+        self._write_header(timestamp_offset)
+        self.file.close()
+
+
+class RawVideoReader:
+
+    def __init__(self, filename, mode='r'):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        size = struct.calcsize(HEADER_FORMAT)
+        magic, self.width, self.height, dtype, self.framerate, self.frame_count, timestamp_offset, settings_length = \
+            struct.unpack(HEADER_FORMAT, header[:size])
+        assert magic == MAGIC, '{} is not a raw hscamera video'.format(filename)
+        self.dtype = np.dtype(dtype.rstrip(b'\x00').decode())
+        self.settings = json.loads(header[size:size + settings_length].decode())
+
+        shape = (self.frame_count, self.height, self.width)
+        if self.frame_count == 0:
+            # An empty file region cannot be memory mapped
+            self.frames = np.empty(shape, dtype=self.dtype)
+        else:
+            self.frames = np.memmap(filename, dtype=self.dtype, mode=mode, offset=HEADER_SIZE, shape=shape)
+        if timestamp_offset and self.frame_count:
+            self.timestamps = np.memmap(filename, dtype='<f8', mode='r', offset=timestamp_offset,
+                                        shape=(self.frame_count,))
+        else:
+            self.timestamps = None
+
+    def __len__(self):
+        return self.frame_count
+
+    def __getitem__(self, item):
+        return self.frames[item]
+
+
+def load_raw(filename):
+    return RawVideoReader(filename).frames
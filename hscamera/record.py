@@ -0,0 +1,66 @@
+import sys
+import time
+import signal
+import logging
+import argparse
+
+from camera import Camera
+from backends import SimulatedBackend
+from reduction import FrameReducer
+
+# Headless recording without Qt or matplotlib, e.g. over ssh on an acquisition node.
+#   python record.py --settings run.json --seconds 10 --format .hsc --workers 4
+# The settings file is the one written by Camera.save_settings. By default frames are streamed to
+# disk as they arrive, --buffer records into the grabber buffer first and saves afterwards.
+
+
+def record(cam, filename, numpics, buffered=False, workers=1):
+    if buffered:
+        assert numpics <= cam.get_max_numpics(), 'At most {} frames fit in the buffer'.format(cam.get_max_numpics())
+        cam.start(numpics)
+        while cam.backend.last_pic_number(cam.mem_handle) < numpics:
+            time.sleep(0.01)
+        cam.stop()
+        # Nothing follows the save so acquisition is not restarted
+        cam.save_vid(filename, workers=workers, restart=False)
+        return
+    recorder = cam.stream_vid(filename, numpics, workers=workers)
+    # Ctrl-C ends the recording early but still closes the file properly
+    signal.signal(signal.SIGINT, lambda signum, frame: recorder.stop())
+    recorder.join()
+    logging.info('Wrote {} frames, {} dropped'.format(recorder.frames_written, recorder.dropped))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Record from the high speed camera without the gui')
+    parser.add_argument('--settings', default=None, help='Settings JSON written by Camera.save_settings')
+    length = parser.add_mutually_exclusive_group(required=True)
+    length.add_argument('--seconds', type=float)
+    length.add_argument('--frames', type=int)
+    parser.add_argument('--output', default=None, help='Output filename, defaults to a timestamp in Camera.filename_base')
+    parser.add_argument('--format', default='.raw', choices=('.raw', '.hsc', '.MP4'),
+                        help='Output format when --output is not given')
+    parser.add_argument('--workers', type=int, default=1, help='Save workers, .hsc compression threads when streaming and MP4 encoder processes with --buffer')
+    parser.add_argument('--buffer', action='store_true', help='Record into the grabber buffer then save')
+    parser.add_argument('--decimate', type=int, default=1)
+    parser.add_argument('--binning', type=int, default=1)
+    parser.add_argument('--simulate', action='store_true', help='Use the simulated frame grabber')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    cam = Camera(settings_file=args.settings, backend=SimulatedBackend() if args.simulate else None)
+    cam.reduction = FrameReducer(decimate=args.decimate, binning=args.binning)
+    filename = args.output
+    if filename is None:
+        filename = cam.default_filename(args.format)
+    numpics = args.frames if args.frames is not None else int(round(args.seconds * cam.settings['framerate']))
+    logging.info('Recording {} frames to {}'.format(numpics, filename))
+    try:
+        record(cam, filename, numpics, buffered=args.buffer, workers=args.workers)
+    finally:
+        cam.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
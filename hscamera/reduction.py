@@ -0,0 +1,52 @@
+import numpy as np
+
+
+class FrameReducer:
+    # Cuts the data written by the save and stream pipelines.
+    #   decimate  keep every decimate-th picture, counted from the first picture of the recording
+    #   binning   average binning x binning blocks of pixels
+    #   crop      (x, y, width, height) sub region of the sensor ROI, applied before binning
+    # All steps work on whole (n, height, width) stacks with slicing and reshapes. A correction
+    # (calibration.FlatFieldCorrector) is applied at full sensor resolution after decimation.
+
+    def __init__(self, decimate=1, binning=1, crop=None):
+        assert decimate >= 1 and binning >= 1, 'Decimation and binning must be at least 1'
+        self.decimate = decimate
+        self.binning = binning
+        self.crop = crop
+
+    def is_identity(self):
+        return self.decimate == 1 and self.binning == 1 and self.crop is None
+
+    def output_shape(self, height, width):
+        if self.crop is not None:
+            width, height = self.crop[2], self.crop[3]
+        return height // self.binning, width // self.binning
+
+    def keeps(self, index, first_index=1):
+        return (index - first_index) % self.decimate == 0
+
+    def kept_indices(self, start, stop, first_index=1):
+        # Picture numbers in start..stop-1 that survive decimation
+        offset = (first_index - start) % self.decimate
+        return np.arange(start + offset, stop, self.decimate)
+
+    def reduce_frames(self, frames, correction=None):
+        # Spatial reduction of an (n, height, width) stack
+        if correction is not None:
+            frames = correction(frames)
+        if self.crop is not None:
+            x, y, width, height = self.crop
+            frames = frames[:, y:y + height, x:x + width]
+        if self.binning > 1:
+            b = self.binning
+            n, height, width = frames.shape
+            height, width = height // b * b, width // b * b
+            blocks = frames[:, :height, :width].reshape(n, height // b, b, width // b, b)
+            frames = (blocks.sum(axis=(2, 4), dtype=np.uint32) // (b * b)).astype(np.uint8)
+        return frames
+
+    def apply(self, frames, start, first_index=1, correction=None):
+        # frames holds pictures start.. of a recording that began at first_index
+        offset = (first_index - start) % self.decimate
+        return self.reduce_frames(frames[offset::self.decimate], correction)
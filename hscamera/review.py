@@ -0,0 +1,89 @@
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from preview import bin_image
+
+
+class BufferReview:
+    # Browses a finished take while it is still in the grabber buffer, before anything is written.
+    # Scrubbing is served from a thumbnail index holding one small strided sample for every
+    # thumb_every-th picture, so the index stays small however long the take is. Thumbnails are made
+    # the first time they are asked for or by build() in the background. Full frames, binned to the
+    # display size, are kept in an LRU cache so stepping back and forth does not redo the work.
+
+    max_thumbnails = 20000
+    thumb_size = 64
+
+    def __init__(self, cam, display_size=(512, 512), cache_size=128):
+        assert not cam.started, 'Stop acquisition before reviewing the buffer'
+        self.cam = cam
+        self.numpics = cam.numpics
+        height, width = cam.settings['height'], cam.settings['width']
+        self.thumb_every = max(1, math.ceil(self.numpics / self.max_thumbnails))
+        self.thumb_stride = max(1, math.ceil(max(height, width) / self.thumb_size))
+        self.display_factor = max(1, min(height // display_size[0], width // display_size[1]))
+
+        shape = (-(-height // self.thumb_stride), -(-width // self.thumb_stride))
+        self.thumbnails = np.zeros((-(-self.numpics // self.thumb_every),) + shape, dtype=np.uint8)
+        self.built = np.zeros(len(self.thumbnails), dtype=bool)
+
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = threading.Event()
+
+        self.in_point = 1
+        self.out_point = self.numpics
+
+    def thumbnail(self, index):
+        # Small image of the indexed picture nearest to index (picture numbers start at 1)
+        k = min((index - 1) // self.thumb_every, len(self.thumbnails) - 1)
+        if not self.built[k]:
+            im = self.cam.get_img(k * self.thumb_every + 1)
+            self.thumbnails[k] = im[::self.thumb_stride, ::self.thumb_stride]
+            self.built[k] = True
+        return self.thumbnails[k]
+
+    def frame(self, index):
+        with self._lock:
+            if index in self._cache:
+                self._cache.move_to_end(index)
+                return self._cache[index]
+        im = bin_image(self.cam.get_img(index), self.display_factor)
+        with self._lock:
+            self._cache[index] = im
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return im
+
+    def build(self):
+        # Fills the thumbnail index on a background thread
+        self._running.set()
+        self._thread = threading.Thread(target=self._build, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _build(self):
+        for k in range(len(self.thumbnails)):
+            if not self._running.is_set():
+                break
+            self.thumbnail(k * self.thumb_every + 1)
+
+    def set_in(self, index):
+        self.in_point = max(1, min(index, self.out_point))
+
+    def set_out(self, index):
+        self.out_point = min(self.numpics, max(index, self.in_point))
+
+    def selection(self):
+        # start and stop picture numbers of the selection, as taken by save_vid
+        return self.in_point, self.out_point + 1
@@ -0,0 +1,77 @@
+import time
+import queue
+import logging
+import threading
+
+
+class SaveQueue:
+    # Saves snapshots one after another on a background thread so the camera can record the next
+    # take while earlier ones are encoded. Each job is a dict that is updated as it progresses:
+    #   filename, frames, saved, status ('queued', 'saving', 'done' or 'failed'), error, submitted, finished
+
+    def __init__(self, workers=1, write_index=True, monitor=None):
+        # monitor (an AcquisitionMonitor) is told about every frame saved
+        self.workers = workers
+        self.write_index = write_index
+        self.monitor = monitor
+        self.jobs = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, snapshot, filename, workers=None, sidecar=None):
+        # sidecar optionally names the acquisition statistics file written after the video
+        job = {'filename': filename, 'frames': len(snapshot), 'saved': 0, 'status': 'queued', 'error': None,
+               'submitted': time.time(), 'finished': None}
+        with self._lock:
+            self.jobs.append(job)
+        self._queue.put((job, snapshot, self.workers if workers is None else workers, sidecar))
+        logging.info('Queued {} frames for saving to {}'.format(len(snapshot), filename))
+        return job
+
+    def status(self):
+        with self._lock:
+            return [dict(job) for job in self.jobs]
+
+    def pending(self):
+        with self._lock:
+            return sum(job['status'] in ('queued', 'saving') for job in self.jobs)
+
+    def join(self):
+        # Waits for every job submitted so far
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _set(self, job, **values):
+        with self._lock:
+            job.update(values)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            job, snapshot, workers, sidecar = item
+            self._set(job, status='saving')
+            try:
+                written = snapshot.save(job['filename'], signal=lambda saved: self._set(job, saved=saved),
+                                        write_index=self.write_index, workers=workers, monitor=self.monitor,
+                                        sidecar=sidecar)
+                if written:
+                    self._set(job, status='done', finished=time.time())
+                    snapshot.discard()
+                else:
+                    # Only numbered segments were left, a spilled take is kept so it can be encoded again
+                    self._set(job, status='failed', error='{} was not written'.format(job['filename']),
+                              finished=time.time(), spill_file=snapshot.spill_file)
+            except Exception as error:
+                # A spilled take is left on disk so it is not lost
+                logging.error('Saving {} failed: {}'.format(job['filename'], error))
+                self._set(job, status='failed', error=str(error), finished=time.time(), spill_file=snapshot.spill_file)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,100 @@
+import os
+import time
+import logging
+
+import numpy as np
+
+from frame_index import FrameIndexWriter, index_filename
+from instrumentation import write_sidecar
+from parallel_save import encode_parallel
+from rawvideo import RawVideoWriter
+from writers import open_writer
+
+
+class Snapshot:
+    # Frames copied out of the grabber buffer together with their capture times and the camera
+    # settings at the time, so they can be saved after the buffer has been reused.
+    # frames may be a memmap onto a raw spill file when the take did not fit in memory, the spill
+    # file is removed by discard().
+    # time_source says where times came from as in frame_index.py, acquisition holds the monitor's
+    # 'final' counters and 'history' at the time of the copy for the statistics sidecar.
+
+    def __init__(self, frames, times, first_index, settings, frame_numbers=None, spill_file=None,
+                 time_source='nominal', acquisition=None):
+        self.frames = frames
+        self.times = times
+        self.first_index = first_index
+        self.settings = dict(settings)
+        if frame_numbers is None:
+            frame_numbers = np.arange(first_index, first_index + len(frames))
+        self.frame_numbers = frame_numbers
+        self.spill_file = spill_file
+        self.time_source = time_source
+        self.acquisition = acquisition
+
+    def __len__(self):
+        return len(self.frames)
+
+    def save(self, filename, signal=None, chunk=64, write_index=True, workers=4, monitor=None, sidecar=None):
+        # With workers > 1 an MP4 is encoded on that many processes like Camera.save_vid does.
+        # monitor (an AcquisitionMonitor) is told what is written and sidecar names a statistics file.
+        # Returns True once filename has been written, False if the numbered segments were kept instead.
+        t = time.perf_counter()
+        if workers > 1 and os.path.splitext(filename)[1].lower() not in ('.raw', '.hsc'):
+            written = self._save_parallel(filename, workers, signal, chunk)
+            if monitor is not None:
+                monitor.record_saved(len(self.frames), self.frames.nbytes)
+        else:
+            height, width = self.frames.shape[1:]
+            writer = open_writer(filename, width, height, framerate=self.settings['framerate'],
+                                 settings=self.settings, workers=workers)
+            for start in range(0, len(self.frames), chunk):
+                frames = self.frames[start:start + chunk]
+                writer.add_frames(frames)
+                if monitor is not None:
+                    monitor.record_saved(len(frames), frames.nbytes)
+                if signal is not None:
+                    signal(min(start + chunk, len(self.frames)))
+            writer.close()
+            written = True
+        if not written:
+            logging.warning('{} was not written, the index and statistics are left out'.format(filename))
+            return False
+        if write_index:
+            index = FrameIndexWriter(index_filename(filename), framerate=self.settings['framerate'],
+                                     time_source=self.time_source)
+            index.add_many(self.frame_numbers, self.times)
+            index.close()
+        if sidecar is not None and self.acquisition is not None:
+            duration = max(time.perf_counter() - t, 1e-9)
+            final = dict(self.acquisition['final'], saved_frames=len(self.frames), save_fps=len(self.frames) / duration,
+                         save_mbps=self.frames.nbytes / duration / 1e6)
+            write_sidecar(sidecar, self.settings, final, self.acquisition['history'])
+        logging.info('Saved {} frames to {}'.format(len(self.frames), filename))
+        return True
+
+    def _save_parallel(self, filename, workers, signal, chunk):
+        # A spilled take is already a raw container, frames held in memory are dumped to one first.
+        # The dump and the encode each count for half of the frames passed to signal.
+        if self.spill_file is not None:
+            return encode_parallel(self.spill_file, filename, workers, signal)
+        raw_filename = filename + '.dump.raw'
+        height, width = self.frames.shape[1:]
+        try:
+            dump = RawVideoWriter(raw_filename, width, height, framerate=self.settings['framerate'],
+                                  settings=self.settings)
+            for start in range(0, len(self.frames), chunk):
+                dump.add_frames(self.frames[start:start + chunk])
+                if signal is not None:
+                    signal(dump.frame_count // 2)
+            dump.close()
+            progress = None if signal is None else lambda encoded: signal((len(self.frames) + encoded) // 2)
+            return encode_parallel(raw_filename, filename, workers, progress)
+        finally:
+            if os.path.exists(raw_filename):
+                os.remove(raw_filename)
+
+    def discard(self):
+        self.frames = None
+        if self.spill_file is not None and os.path.exists(self.spill_file):
+            os.remove(self.spill_file)
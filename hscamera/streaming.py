@@ -0,0 +1,160 @@
+import os
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class StreamRecorder:
+    # Follows the grabber's last picture number around the ring buffer and writes frames to disk
+    # while acquisition continues. A reader thread copies new frames out of the ring into a bounded
+    # queue, a writer thread drains it into the writer. If the writer falls so far behind that the
+    # grabber laps the reader, the overwritten frames are skipped and counted in self.dropped.
+
+    poll_interval = 0.001
+
+    def __init__(self, cam, writer, numpics=None, queue_size=256, signal=None, sidecar=None, cpus=None,
+                 fill_dropped=False, index=None):
+        # cpus optionally pins the reader and writer threads to a set of cores.
+        # fill_dropped writes blank frames in place of dropped ones so frame k of the output is
+        # always picture start_index + k.
+        self.cpus = cpus
+        self.fill_dropped = fill_dropped
+        self.reduction = cam.reduction
+        self.correction = cam.correction
+        # Optional frame_index.FrameIndexWriter given a row for every picture, written or dropped
+        self.index = index
+        self.cam = cam
+        self.writer = writer
+        self.numpics = numpics
+        self.signal = signal
+        self.sidecar = sidecar
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        self.frames_read = 0
+        self.frames_written = 0
+        self.dropped = 0
+
+        self._stop = threading.Event()
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._writer = threading.Thread(target=self._write, daemon=True)
+
+    def start(self, start_index=None):
+        # start_index lets several recorders begin at aligned picture numbers, by default the next picture
+        if start_index is None:
+            start_index = self.cam.backend.last_pic_number(self.cam.mem_handle) + 1
+        self.next_index = start_index
+        self.start_index = self.next_index
+        self.cam.monitor.reset(baseline=self.next_index - 1)
+        self.cam.monitor.consumed_index = self.next_index - 1
+        logging.info('Streaming to disk from frame {}'.format(self.next_index))
+        self._reader.start()
+        self._writer.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout=None):
+        self._reader.join(timeout)
+        self._writer.join(timeout)
+
+    def is_alive(self):
+        return self._writer.is_alive()
+
+    def _done(self):
+        return self.numpics is not None and self.next_index >= self.start_index + self.numpics
+
+    def _oldest_valid(self, last):
+        # The slot after the last complete picture may already be being overwritten by the grabber
+        return last - self.cam.numpics + 2
+
+    def _fill(self, start, stop):
+        if self.fill_dropped:
+            shape = self.reduction.output_shape(self.cam.settings['height'], self.cam.settings['width'])
+            blank = np.zeros(shape, dtype=np.uint8)
+            for i in self.reduction.kept_indices(start, stop, self.start_index):
+                self.queue.put(blank)
+
+    def _frame_time(self, index):
+        # Grabber time if available, otherwise the host monotonic time the frame was seen
+        times = self.cam.backend.timestamps(index, index + 1, self.cam.mem_handle)
+        if times is None:
+            return time.monotonic()
+        return times[0]
+
+    def _index_dropped(self, start, stop):
+        if self.index is not None:
+            for i in self.reduction.kept_indices(start, stop, self.start_index):
+                self.index.add(i, float('nan'), dropped=True, written=self.fill_dropped)
+
+    def _pin(self):
+        if self.cpus is not None:
+            # On Linux pid 0 applies the affinity to the calling thread only
+            os.sched_setaffinity(0, self.cpus)
+
+    def _read(self):
+        self._pin()
+        backend = self.cam.backend
+        while not self._done():
+            last = backend.last_pic_number(self.cam.mem_handle)
+            if self.numpics is not None:
+                last = min(last, self.start_index + self.numpics - 1)
+            if last < self.next_index:
+                if self._stop.is_set():
+                    break
+                time.sleep(self.poll_interval)
+                continue
+            while self.next_index <= last:
+                # A writer slower than acquisition never catches up, so stop is checked here as well
+                if self._stop.is_set():
+                    break
+                oldest = self._oldest_valid(backend.last_pic_number(self.cam.mem_handle))
+                if self.next_index < oldest:
+                    logging.warning('Stream overrun, dropping frames {} to {}'.format(self.next_index, oldest - 1))
+                    self.dropped += oldest - self.next_index
+                    self.cam.monitor.record_dropped(oldest - self.next_index)
+                    self._fill(self.next_index, oldest)
+                    self._index_dropped(self.next_index, oldest)
+                    self.next_index = oldest
+                    continue
+                if not self.reduction.keeps(self.next_index, self.start_index):
+                    self.next_index += 1
+                    continue
+                im = np.array(self.reduction.reduce_frames(self.cam.get_img(self.next_index)[np.newaxis], self.correction)[0])
+                # The grabber may have lapped us while copying
+                if self.next_index < self._oldest_valid(backend.last_pic_number(self.cam.mem_handle)):
+                    self.dropped += 1
+                    self.cam.monitor.record_dropped(1)
+                    self._fill(self.next_index, self.next_index + 1)
+                    self._index_dropped(self.next_index, self.next_index + 1)
+                else:
+                    if self.index is not None:
+                        self.index.add(self.next_index, self._frame_time(self.next_index))
+                    self.queue.put(im)
+                    self.frames_read += 1
+                self.next_index += 1
+                self.cam.monitor.consumed_index = self.next_index - 1
+            if self._stop.is_set():
+                break
+        self.queue.put(None)
+
+    def _write(self):
+        self._pin()
+        while True:
+            im = self.queue.get()
+            if im is None:
+                break
+            self.writer.add_frame(im)
+            self.frames_written += 1
+            self.cam.monitor.record_saved(1, im.nbytes)
+            if self.signal is not None:
+                self.signal(self.frames_written)
+        self.writer.close()
+        if self.index is not None:
+            self.index.close()
+        self.cam.monitor.consumed_index = None
+        logging.info('Streaming finished, {} frames written, {} dropped'.format(self.frames_written, self.dropped))
+        if self.sidecar is not None:
+            self.cam.monitor.write_sidecar(self.sidecar)
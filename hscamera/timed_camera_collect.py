@@ -1,55 +1,165 @@
-from threading import Timer
-from microscope.camerahs import Camera
+import os
+import json
+import time
+import queue
+import logging
+import threading
 
+from camera import Camera
 
-def collect_movie(filename=None, numpics=None):
-    cam = Camera(filename=filename)
-    cam.initialise()
-    cam.set_autosave(True)
-    cam.grab(numpics=numpics)
-    cam.resource_cleanup()
-    cam.close_display()
-    del cam
+# Time-lapse capture of a series of movies.
+# One Camera is kept initialised for the whole campaign. Capture k fires at start + k * interval
+# regardless of how long earlier captures took, so the schedule does not drift. After each capture
+# the frames are copied out of the grabber buffer and saved on a background thread, overlapping
+# the save of movie k with the wait for movie k+1. The job list is persisted to a JSON state file
+# so an interrupted campaign can be resumed.
 
 
+def collect_movie(cam, numpics, timeout=5.0):
+    # Records numpics into the buffer, waits for them and returns a snapshot of the frames.
+    # Raises RuntimeError if they have not all arrived timeout seconds after the take should have ended.
+    cam.start(numpics)
+    deadline = time.perf_counter() + numpics / cam.settings['framerate'] + timeout
+    try:
+        while cam.backend.last_pic_number(cam.mem_handle) < numpics:
+            if time.perf_counter() > deadline:
+                raise RuntimeError('Only {} of {} frames arrived'.format(cam.backend.last_pic_number(cam.mem_handle), numpics))
+            time.sleep(0.001)
+    finally:
+        cam.stop()
+    return cam.snapshot(1, numpics + 1)
 
 
+class CaptureScheduler:
 
+    # Job states a campaign can be stopped in part way through a capture
+    interrupted = ('capturing', 'queued', 'saving')
 
-class CameraTimer(object):
-    def __init__(self, interval=60, numpics=50, nummovies=2, filename=None, startfunction=None):
-        self._timer     = None
-        self.interval   = interval
+    def __init__(self, interval=60, numpics=50, nummovies=2, filename=None, cam=None, state_file=None,
+                 start_time=None, save_queue_size=2):
+        self.cam = Camera() if cam is None else cam
+        self.interval = interval
         self.numpics = numpics
-        self.nummovies = nummovies
-        self.filename = filename
-        self.startfunction   = startfunction
-        #self.stopfunction = stopfunction
-        self.counter=0
-        self.is_running = False
-        self.start()
+        if filename is None:
+            filename = self.cam.default_filename()
+        filename = os.path.expanduser(filename)
+        self.state_file = os.path.splitext(filename)[0] + '_schedule.json' if state_file is None else os.path.expanduser(state_file)
+        if start_time is None:
+            start_time = time.time()
+        base, extension = os.path.splitext(filename)
+        self.jobs = [{'index': k, 'due': start_time + k * interval,
+                      'filename': '{}_{:03d}{}'.format(base, k, extension), 'status': 'pending'}
+                     for k in range(nummovies)]
 
-    def _run(self):
-        self.is_running = False
-        self.start()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._save_queue = queue.Queue(maxsize=save_queue_size)
+        self._thread = None
+        self._saver = None
 
+    @classmethod
+    def resume(cls, state_file, cam=None, missed='reschedule'):
+        # Captures interrupted while capturing, queued or saving are taken again, other jobs keep their
+        # status so a slot skipped by an earlier resume stays skipped. Slots whose time has passed are
+        # either moved on to run every interval from now (missed='reschedule') or marked 'missed' and
+        # left out (missed='skip') so the remaining captures keep their original times.
+        assert missed in ('reschedule', 'skip'), "missed must be 'reschedule' or 'skip'"
+        with open(os.path.expanduser(state_file)) as f:
+            state = json.load(f)
+        scheduler = cls(interval=state['interval'], numpics=state['numpics'], nummovies=0, cam=cam,
+                        state_file=state_file)
+        scheduler.jobs = [dict(job, status='pending') if job['status'] in cls.interrupted else job
+                          for job in state['jobs']]
+        now = time.time()
+        late = [job for job in scheduler.jobs if job['status'] == 'pending' and job['due'] < now]
+        if missed == 'skip':
+            for job in late:
+                job['status'] = 'missed'
+        else:
+            pending = [job for job in scheduler.jobs if job['status'] == 'pending']
+            for k, job in enumerate(pending):
+                job['due'] = max(job['due'], now + k * scheduler.interval)
+        logging.info('Resuming schedule, {} missed slots {}'.format(len(late), 'skipped' if missed == 'skip' else 'rescheduled'))
+        return scheduler
 
     def start(self):
-        self.startfunction(filename=self.filename, numpics=self.numpics)
+        self._persist()
+        self._saver = threading.Thread(target=self._save_loop, daemon=True)
+        self._saver.start()
+        self._thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._thread.start()
 
-        if not self.is_running:
-            self._timer = Timer(self.interval, self._run)
-            self._timer.start()
-            self.is_running = True
+    def stop(self):
+        self._stop.set()
 
-        self.counter += 1
-        if self.counter >= self.nummovies:
-            self.stop()
+    def join(self):
+        if self._thread is not None:
+            self._thread.join()
+        if self._saver is not None:
+            self._saver.join()
+
+    def status(self):
+        with self._lock:
+            counts = {}
+            for job in self.jobs:
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            pending = [job['due'] for job in self.jobs if job['status'] == 'pending']
+            return {'counts': counts, 'next_due_in': min(pending) - time.time() if pending else None,
+                    'save_queue': self._save_queue.qsize()}
+
+    def _set_status(self, job, status, **extra):
+        with self._lock:
+            job['status'] = status
+            job.update(extra)
+        self._persist()
+
+    def _persist(self):
+        with self._lock:
+            state = {'interval': self.interval, 'numpics': self.numpics, 'jobs': self.jobs}
+            with open(self.state_file + '.tmp', 'w') as f:
+                json.dump(state, f, indent=1)
+        os.replace(self.state_file + '.tmp', self.state_file)
+
+    def _capture_loop(self):
+        for job in self.jobs:
+            if job['status'] != 'pending':
+                continue
+            if self._stop.wait(max(job['due'] - time.time(), 0)):
+                break
+            lateness = time.time() - job['due']
+            logging.info('Capturing movie {} ({:.3f} s after schedule)'.format(job['index'], lateness))
+            self._set_status(job, 'capturing', started=time.time(), lateness=lateness)
+            try:
+                snapshot = collect_movie(self.cam, self.numpics)
+            except Exception as error:
+                logging.error('Capture of movie {} failed: {}'.format(job['index'], error))
+                self._set_status(job, 'failed', error=str(error))
+                continue
+            self._set_status(job, 'queued')
+            self._save_queue.put((job, snapshot))
+        self._save_queue.put(None)
+
+    def _save_loop(self):
+        while True:
+            item = self._save_queue.get()
+            if item is None:
+                break
+            job, snapshot = item
+            self._set_status(job, 'saving')
+            try:
+                # Movies are short so they are encoded on this thread rather than split over processes
+                if snapshot.save(job['filename'], write_index=self.cam.write_frame_index, workers=1):
+                    self._set_status(job, 'done', finished=time.time())
+                else:
+                    self._set_status(job, 'failed', error='{} was not written'.format(job['filename']))
+            except Exception as error:
+                logging.error('Saving movie {} failed: {}'.format(job['index'], error))
+                self._set_status(job, 'failed', error=str(error))
 
-    def stop(self):
-        self._timer.cancel()
-        self.is_running = False
 
 if __name__ == '__main__':
-    #CameraTimer(Interval in sec, Numpics per collection, NumMovies, Filename base, function to handle collection)
-    timed_collect = CameraTimer(interval=60, numpics=50, nummovies=2, filename='/home/ppzmis/Videos/test.mp4', startfunction=collect_movie)
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO)
+    #CaptureScheduler(Interval in sec, Numpics per collection, NumMovies, Filename base)
+    scheduler = CaptureScheduler(interval=60, numpics=50, nummovies=2, filename='/home/ppzmis/Videos/test.mp4')
+    scheduler.start()
+    scheduler.join()
@@ -0,0 +1,38 @@
+import os
+
+from rawvideo import RawVideoWriter
+from chunked import ChunkedWriter
+
+# Extensions understood by open_writer
+formats = ('.MP4', '.raw', '.hsc')
+
+
+class MP4Writer:
+
+    def __init__(self, filename, width, height):
+        # labvision is imported here so that recording to .raw or .hsc never loads it (or Qt)
+        from labvision.video import WriteVideo
+        from labvision.images import gray_to_bgr
+        self.gray_to_bgr = gray_to_bgr
+        self.writevid = WriteVideo(filename=filename, frame_size=(height, width, 3))
+
+    def add_frame(self, im):
+        self.writevid.add_frame(self.gray_to_bgr(im))
+
+    def add_frames(self, frames):
+        for im in frames:
+            self.add_frame(im)
+
+    def close(self):
+        self.writevid.close()
+
+
+def open_writer(filename, width, height, framerate=0, settings=None, workers=4):
+    # Output format is chosen from the file extension, .raw for the lossless container,
+    # .hsc for lossless compressed chunks (compressed on workers threads), otherwise MP4
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.raw':
+        return RawVideoWriter(filename, width, height, framerate=framerate, settings=settings)
+    if extension == '.hsc':
+        return ChunkedWriter(filename, width, height, framerate=framerate, settings=settings, workers=workers)
+    return MP4Writer(filename, width, height)
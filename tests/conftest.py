@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+# The package modules import each other by bare name, as when run from hscamera/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'hscamera'))
+
+from backends import SimulatedBackend  # noqa: E402
+from camera import Camera  # noqa: E402
+
+
+@pytest.fixture
+def cam():
+    # Small ROI at a high framerate so the simulated grabber fills a buffer in well under a second
+    cam = Camera(backend=SimulatedBackend())
+    cam.apply_settings({'width': 64, 'height': 32, 'framerate': 2000})
+    yield cam
+    cam.close()
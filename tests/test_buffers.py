@@ -0,0 +1,61 @@
+import time
+
+import numpy as np
+
+
+def wait_for(cam, index, timeout=5):
+    deadline = time.perf_counter() + timeout
+    while cam.backend.last_pic_number(cam.mem_handle) < index:
+        assert time.perf_counter() < deadline, 'Simulated grabber stalled'
+        time.sleep(0.001)
+
+
+def expected(cam, numbers):
+    bank = cam.backend._frame_bank(cam.settings['width'], cam.settings['height'])
+    return bank[np.asarray(numbers) % cam.backend.bank_size]
+
+
+def test_get_frames_is_a_read_only_view(cam):
+    cam.start(20)
+    wait_for(cam, 20)
+    cam.stop()
+    frames = cam.get_frames(3, 9)
+    assert frames.shape == (6, 32, 64)
+    assert not frames.flags.writeable
+    assert np.shares_memory(frames, cam.get_frames(3, 4))
+    np.testing.assert_array_equal(frames, expected(cam, range(3, 9)))
+
+
+def test_get_frames_splits_at_the_ring_wrap(cam):
+    cam.continuous_buffer_bytes = 10 * 64 * 32
+    cam.start()
+    assert cam.numpics == 10
+    wait_for(cam, 25)
+    cam.stop()
+    last = cam.backend.last_pic_number(cam.mem_handle)
+    start = last - cam.numpics + 2
+    frames = cam.get_frames(start, last + 1)
+    np.testing.assert_array_equal(frames, expected(cam, range(start, last + 1)))
+
+
+def test_get_frames_splits_at_segment_boundaries(cam):
+    cam.buffers.single_alloc_limit = 0
+    cam.buffers.segment_bytes = 3 * 64 * 32
+    cam.start(10)
+    assert cam.buffer.segment_numpics == 3
+    assert cam.buffer_stats()['segments'] == 4
+    wait_for(cam, 10)
+    cam.stop()
+    np.testing.assert_array_equal(cam.get_frames(2, 11), expected(cam, range(2, 11)))
+    for index in range(1, 11):
+        np.testing.assert_array_equal(cam.get_img(index), expected(cam, [index])[0])
+
+
+def test_buffer_is_reused_when_it_fits(cam):
+    cam.start(20)
+    cam.stop()
+    cam.start(10)
+    cam.stop()
+    stats = cam.buffer_stats()
+    assert stats['allocations'] == 1
+    assert stats['reuses'] == 1
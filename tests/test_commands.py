@@ -0,0 +1,90 @@
+from camera import Camera
+from commands import CommandChannel
+
+
+class RecordingBackend:
+
+    def __init__(self):
+        self.commands = []
+
+    def send_command(self, command, expect_return_value=False):
+        self.commands.append(command)
+        return '100' if expect_return_value else None
+
+
+def test_repeated_command_is_skipped():
+    backend = RecordingBackend()
+    channel = CommandChannel(backend)
+    channel.set('#e(100)')
+    channel.set('#e(100)')
+    channel.set('#e(200)')
+    assert backend.commands == ['#e(100)', '#e(200)']
+
+
+def test_batch_keeps_last_command_per_code_in_first_use_order():
+    backend = RecordingBackend()
+    channel = CommandChannel(backend)
+    with channel.batch():
+        channel.set('#R(0,0,64,32)')
+        channel.set('#r(100)')
+        channel.set('#R(0,0,128,32)')
+        assert backend.commands == []
+    assert backend.commands == ['#R(0,0,128,32)', '#r(100)']
+
+
+def test_nested_batch_flushes_once_with_the_outer_batch():
+    backend = RecordingBackend()
+    channel = CommandChannel(backend)
+    with channel.batch():
+        channel.set('#G(1)')
+        with channel.batch():
+            channel.set('#G(2)')
+            channel.set('#e(50)')
+        assert backend.commands == []
+        channel.set('#e(60)')
+    assert backend.commands == ['#G(2)', '#e(60)']
+
+
+def test_limit_queries_are_cached_until_roi_or_framerate_change():
+    backend = RecordingBackend()
+    channel = CommandChannel(backend)
+    assert channel.query('#a') == '100'
+    channel.query('#a')
+    assert backend.commands == ['#a']
+    channel.set('#e(10)')
+    channel.query('#a')
+    assert backend.commands == ['#a', '#e(10)']
+    channel.set('#r(200)')
+    channel.query('#a')
+    assert backend.commands == ['#a', '#e(10)', '#r(200)', '#a']
+
+
+def test_invalidate_resends_settings():
+    backend = RecordingBackend()
+    channel = CommandChannel(backend)
+    channel.set('#G(2)')
+    channel.invalidate()
+    channel.set('#G(2)')
+    assert backend.commands == ['#G(2)', '#G(2)']
+
+
+def test_read_back_seeds_the_record_from_the_camera():
+    backend = RecordingBackend()
+    channel = CommandChannel(backend)
+    channel.read_back({'#r': '#r?'})
+    channel.set('#r(100)')
+    channel.set('#e(100)')
+    assert backend.commands == ['#r?', '#e(100)']
+
+
+def test_attaching_camera_skips_settings_it_already_holds(cam, tmp_path):
+    # A second Camera on the same link with the same settings finds the ROI, framerate and exposure
+    # already in place
+    settings_file = str(tmp_path / 'settings.json')
+    cam.save_settings(settings_file)
+    commands = []
+    send_command = cam.backend.send_command
+    cam.backend.send_command = lambda command, expect_return_value=False: (
+        commands.append(command), send_command(command, expect_return_value))[1]
+    Camera(settings_file=settings_file, backend=cam.backend)
+    assert [command for command in commands if command[:2] in ('#R', '#r', '#e')] == ['#R?', '#r?', '#e?']
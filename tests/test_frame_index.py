@@ -0,0 +1,27 @@
+import numpy as np
+
+from frame_index import FrameIndex, FrameIndexWriter, index_filename
+
+
+def test_index_round_trip_with_dropped_rows(tmp_path):
+    filename = index_filename(str(tmp_path / 'take.raw'))
+    writer = FrameIndexWriter(filename, framerate=100, time_source='grabber', chunk=2)
+    writer.add(1, 0.00)
+    writer.add(2, float('nan'), dropped=True, written=False)
+    writer.add(3, 0.02)
+    writer.add_many(np.array([4, 5, 6]), np.array([0.03, np.nan, 0.05]), dropped=[False, True, False])
+    writer.close()
+
+    index = FrameIndex(filename)
+    assert len(index) == 6
+    assert index.time_source == 'grabber'
+    assert list(index.frame_number) == [1, 2, 3, 4, 5, 6]
+    assert list(index.dropped) == [False, True, False, False, True, False]
+    assert list(index.video_frame) == [0, -1, 1, 2, -1, 3]
+    assert index.time_of_frame(2) == 0.03
+    assert index.frame_at_time(0.035) == 2
+    assert index.frame_at_time(0.045) == -1
+
+
+def test_index_filename_sits_next_to_the_video():
+    assert index_filename('/data/run_01.MP4') == '/data/run_01_index.npz'
@@ -0,0 +1,36 @@
+import numpy as np
+
+from reduction import FrameReducer
+
+
+def test_kept_indices_count_from_the_first_picture():
+    reducer = FrameReducer(decimate=3)
+    assert list(reducer.kept_indices(1, 11)) == [1, 4, 7, 10]
+    # A chunk starting part way through keeps the same pictures
+    assert list(reducer.kept_indices(5, 11)) == [7, 10]
+    assert list(reducer.kept_indices(5, 11, first_index=5)) == [5, 8]
+
+
+def test_apply_matches_kept_indices_across_chunks():
+    reducer = FrameReducer(decimate=4)
+    frames = np.arange(1, 21, dtype=np.uint8)[:, np.newaxis, np.newaxis] * np.ones((1, 2, 2), dtype=np.uint8)
+    kept = []
+    for start in range(1, 21, 6):
+        chunk = frames[start - 1:start + 5]
+        kept.extend(reducer.apply(chunk, start)[:, 0, 0])
+    assert kept == list(reducer.kept_indices(1, 21))
+
+
+def test_crop_then_binning():
+    reducer = FrameReducer(binning=2, crop=(2, 0, 4, 4))
+    frames = np.arange(4 * 8, dtype=np.uint8).reshape(1, 4, 8)
+    out = reducer.apply(frames, 1)
+    assert out.shape == (1,) + reducer.output_shape(4, 8) == (1, 2, 2)
+    assert out[0, 0, 0] == (2 + 3 + 10 + 11) // 4
+
+
+def test_correction_is_applied_before_spatial_reduction():
+    reducer = FrameReducer(binning=2)
+    frames = np.full((1, 2, 2), 10, dtype=np.uint8)
+    out = reducer.apply(frames, 1, correction=lambda f: f - 10)
+    assert out[0, 0, 0] == 0
@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+
+import snapshot as snapshot_module
+from frame_index import index_filename
+from save_queue import SaveQueue
+from snapshot import Snapshot
+
+
+def make_snapshot(tmp_path, spill=False):
+    frames = np.zeros((10, 32, 64), dtype=np.uint8)
+    spill_file = None
+    if spill:
+        spill_file = str(tmp_path / 'take.raw')
+        open(spill_file, 'wb').close()
+    return Snapshot(frames, np.arange(10) / 2000, 1, {'framerate': 2000}, spill_file=spill_file)
+
+
+def test_raw_save_is_done_and_indexed(tmp_path):
+    queue = SaveQueue()
+    filename = str(tmp_path / 'take.raw')
+    job = queue.submit(make_snapshot(tmp_path), filename)
+    queue.join()
+    queue.close()
+    assert job['status'] == 'done'
+    assert os.path.exists(filename)
+    assert os.path.exists(index_filename(filename))
+
+
+def test_unwritten_save_fails_and_keeps_the_spill_file(tmp_path, monkeypatch):
+    # As when ffmpeg is missing and only the numbered segments are left
+    monkeypatch.setattr(snapshot_module, 'encode_parallel', lambda *args, **kwargs: False)
+    queue = SaveQueue(workers=4)
+    snapshot = make_snapshot(tmp_path, spill=True)
+    job = queue.submit(snapshot, str(tmp_path / 'take.MP4'))
+    queue.join()
+    queue.close()
+    assert job['status'] == 'failed'
+    assert job['spill_file'] == snapshot.spill_file
+    assert os.path.exists(snapshot.spill_file)
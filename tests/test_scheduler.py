@@ -0,0 +1,25 @@
+import json
+import time
+
+import pytest
+
+from timed_camera_collect import CaptureScheduler, collect_movie
+
+
+def test_collect_movie_times_out_on_a_stalled_camera(cam, monkeypatch):
+    monkeypatch.setattr(cam.backend, 'last_pic_number', lambda mem_handle: 0)
+    with pytest.raises(RuntimeError):
+        collect_movie(cam, 20, timeout=0.05)
+    assert not cam.started
+
+
+def test_resume_keeps_done_and_missed_jobs(cam, tmp_path):
+    state_file = str(tmp_path / 'schedule.json')
+    now = time.time()
+    statuses = ['done', 'missed', 'capturing', 'saving', 'pending']
+    jobs = [{'index': k, 'due': now + k, 'filename': str(tmp_path / 'm_{}.raw'.format(k)), 'status': status}
+            for k, status in enumerate(statuses)]
+    with open(state_file, 'w') as f:
+        json.dump({'interval': 1, 'numpics': 10, 'jobs': jobs}, f)
+    scheduler = CaptureScheduler.resume(state_file, cam=cam)
+    assert [job['status'] for job in scheduler.jobs] == ['done', 'missed', 'pending', 'pending', 'pending']
@@ -0,0 +1,51 @@
+import time
+
+import numpy as np
+
+from streaming import StreamRecorder
+
+
+class SlowWriter:
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.frames = []
+        self.closed = False
+
+    def add_frame(self, im):
+        time.sleep(self.delay)
+        self.frames.append(np.array(im))
+
+    def close(self):
+        self.closed = True
+
+
+def test_stream_writes_every_frame_when_it_keeps_up(cam):
+    cam.start()
+    writer = SlowWriter()
+    recorder = StreamRecorder(cam, writer, numpics=50)
+    recorder.start()
+    recorder.join(5)
+    assert not recorder.is_alive()
+    assert writer.closed
+    assert recorder.dropped == 0
+    assert len(writer.frames) == 50
+    bank = cam.backend._frame_bank(64, 32)
+    for k, im in enumerate(writer.frames):
+        np.testing.assert_array_equal(im, bank[(recorder.start_index + k) % cam.backend.bank_size])
+
+
+def test_overrun_drops_frames_and_stop_is_honoured(cam):
+    # A ring of 8 pictures and a writer far slower than 2000 fps keeps the reader behind the grabber
+    cam.continuous_buffer_bytes = 8 * 64 * 32
+    cam.start()
+    writer = SlowWriter(delay=0.005)
+    recorder = StreamRecorder(cam, writer, queue_size=4)
+    recorder.start()
+    time.sleep(0.3)
+    assert recorder.dropped > 0
+    recorder.stop()
+    recorder.join(2)
+    assert not recorder.is_alive()
+    assert writer.closed
+    assert cam.monitor.frames_dropped == recorder.dropped